@@ -1,8 +1,24 @@
 from .cmake_integration import CodeGeneration
-from .codegen import (
-    generate_pack_info, generate_pack_info_for_field, generate_pack_info_from_kernel,
-    generate_mpidtype_info_from_kernel, generate_sweep)
 
 __all__ = ['CodeGeneration',
-           'generate_sweep', 'generate_pack_info_from_kernel', 'generate_pack_info_for_field', 'generate_pack_info',
-           'generate_mpidtype_info_from_kernel']
+           'generate_sweep', 'generate_pack_info_from_kernel', 'generate_pack_info_from_kernels',
+           'generate_pack_info_for_field', 'generate_pack_info',
+           'generate_mpidtype_info_from_kernel', 'generate_block_weights', 'generate_communication_hiding_timestep',
+           'generate_checkpoint']
+
+# the generation functions pull in sympy, pystencils and jinja2 - they are only imported when first accessed,
+# such that e.g. querying CMake information stays fast
+_LAZY_ATTRIBUTES = {name: 'codegen' for name in __all__ if name != 'CodeGeneration'}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        from importlib import import_module
+        value = getattr(import_module('.' + _LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,36 +1,71 @@
+import logging
 from collections import OrderedDict, defaultdict
+from functools import lru_cache
 from itertools import product
 from typing import Dict, Optional, Sequence, Tuple
 
-from jinja2 import Environment, PackageLoader, StrictUndefined
+import sympy as sp
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader, StrictUndefined
 
 from pystencils import (
-    Assignment, AssignmentCollection, Field, FieldType, create_kernel, create_staggered_kernel)
-from pystencils.astnodes import KernelFunction
+    Assignment, AssignmentCollection, Field, FieldType, TypedSymbol, create_kernel, create_staggered_kernel)
+from pystencils.astnodes import KernelFunction, LoopOverCoordinate, ResolvedFieldAccess, SympyAssignment
 from pystencils.backends.cbackend import get_headers
 from pystencils.backends.simd_instruction_sets import get_supported_instruction_sets
+from pystencils.data_types import PointerType, cast_func, create_type, get_base_type
+from pystencils.field import layout_string_to_tuple
 from pystencils.stencil import inverse_direction, offset_to_direction_string
+from pystencils_walberla.halo_spec import (
+    comm_directions, communication_spec, format_communication_report, union_communication_spec)
 from pystencils_walberla.jinja_filters import add_pystencils_filters_to_jinja_env
+from pystencils_walberla.kernel_fusion import (
+    check_temporal_blocking, fuse_stages, overlap_widths, required_ghost_layers)
+from pystencils_walberla.symbolic_optimizations import (
+    STAGES, format_operation_count_report, optimize_assignments)
 
 __all__ = ['generate_sweep', 'generate_pack_info', 'generate_pack_info_for_field', 'generate_pack_info_from_kernel',
-           'generate_mpidtype_info_from_kernel', 'default_create_kernel_parameters', 'KernelInfo']
+           'generate_pack_info_from_kernels',
+           'generate_mpidtype_info_from_kernel', 'generate_block_weights', 'generate_communication_hiding_timestep',
+           'generate_checkpoint',
+           'default_create_kernel_parameters', 'KernelInfo']
+
+logger = logging.getLogger(__name__)
 
 
 def generate_sweep(generation_context, class_name, assignments,
                    namespace='pystencils', field_swaps=(), staggered=False, varying_parameters=(),
-                   inner_outer_split=False,
-                   **create_kernel_params):
+                   inner_outer_split=False, storage_data_type=None, symbolic_optimizations=False,
+                   cache_blocking=False, layout=None, **create_kernel_params):
     """Generates a waLBerla sweep from a pystencils representation.
 
     The constructor of the C++ sweep class expects all kernel parameters (fields and parameters) in alphabetical order.
     Fields have to passed using BlockDataID's pointing to walberla fields
 
+    If OpenMP is enabled and the sweep has temporary fields (see `field_swaps`), the generated class additionally
+    gets a `firstTouch` method. It creates the temporary fields and writes zeros to them, using the same loop
+    structure and OpenMP schedule as the compute kernel, such that each memory page is placed in the NUMA domain of
+    the thread that later updates it. Only the temporary fields can be placed this way: they are allocated
+    uninitialized, while `field::addToStorage` already writes the initial value into the fields of the block
+    storage when they are allocated, which places their pages in the domain of the allocating thread. Only the
+    cells the kernel iterates over are written: pages that hold nothing but ghost layers, e.g. the outermost
+    xy-planes of 'fzyx' fields, are placed by whichever thread touches them first. This is not available for
+    staggered kernels.
+
     Args:
         generation_context: build system context filled with information from waLBerla's CMake. The context for example
                             defines where to write generated files, if OpenMP is available or which SIMD instruction
                             set should be used. See waLBerla examples on how to get a context.
         class_name: name of the generated sweep class
-        assignments: list of assignments defining the stencil update rule or a :class:`KernelFunction`
+        assignments: list of assignments defining the stencil update rule or a :class:`KernelFunction`.
+                     Alternatively an ordered sequence of assignment collections (or assignment lists), that are
+                     executed one after another by one fused sweep, see `pystencils_walberla.kernel_fusion`.
+                     Stages that can not be fused per cell are run with overlapped tile temporal blocking, using
+                     the tile sizes of `cache_blocking`. This is only available on CPU and not together with
+                     staggered kernels or `inner_outer_split`. The overlap reaches into the ghost layers: pass the
+                     number of ghost layers of the waLBerla fields as `ghost_layers` to check at generation time
+                     that they suffice, otherwise this is checked at runtime. With OpenMP, tiles are processed in
+                     colors by the parity of their index, such that concurrent tiles including their overlaps are
+                     disjoint. This requires tiles at least twice as wide as the overlap, checked at runtime.
         namespace: the generated class is accessible as walberla::<namespace>::<class_name>
         field_swaps: sequence of field pairs (field, temporary_field). The generated sweep only gets the first field
                      as argument, creating a temporary field internally which is swapped with the first field after
@@ -41,7 +76,27 @@ def generate_sweep(generation_context, class_name, assignments,
                             the varying_parameters sequence can contain parameter names, which are always expected by
                             the C++ class constructor even if the kernel does not need them.
         inner_outer_split: if True generate a sweep that supports separate iteration over inner and outer regions
-                           to allow for communication hiding.
+                           to allow for communication hiding. The outer region consists of six slabs, whose widths
+                           can be set per face. With OpenMP on CPU, all slabs are updated in one parallel region by
+                           default, split into chunks that are dynamically scheduled among the threads.
+        storage_data_type: data type the fields are stored in, either a single type for all fields or a dict mapping
+                           fields (or field names) to types. Computations are carried out in the compute type
+                           `data_type`, i.e. field reads are converted up and writes are converted down. Temporary
+                           fields of `field_swaps` are stored like their main field. Vectorization is switched off
+                           for kernels that mix storage and compute types.
+        symbolic_optimizations: True to run all symbolic optimization stages on the assignments before the kernel is
+                                created, or a sequence of stage names, see
+                                `pystencils_walberla.symbolic_optimizations.STAGES`. The operation counts per cell
+                                before and after each stage are logged with level INFO.
+        cache_blocking: True or a sequence of default tile sizes, one per spatial dimension, to tile the iteration
+                        space for better cache reuse. The tile sizes are parameters of the generated constructor
+                        (tileSizeX, tileSizeY, tileSizeZ), such that they can be tuned at runtime. With OpenMP, the
+                        tiles are distributed among the threads. Only available for the 'cpu' target.
+        layout: memory layout of the waLBerla fields, 'fzyx' (structure of arrays) or 'zyxf' (array of structures).
+                The kernels are specialized to a unit stride of the fastest coordinate (x for 'fzyx', the index for
+                'zyxf'), the generated code checks once per block that the fields have this layout. Vectorization is
+                switched off for 'zyxf' fields with index dimensions, since the vectorizer requires unit stride in x.
+                By default, the layouts of the pystencils fields are used with strides read at runtime.
         **create_kernel_params: remaining keyword arguments are passed to `pystencils.create_kernel`
     """
     create_kernel_params = default_create_kernel_parameters(generation_context, create_kernel_params)
@@ -49,6 +104,45 @@ def generate_sweep(generation_context, class_name, assignments,
     if not generation_context.cuda and create_kernel_params['target'] == 'gpu':
         return
 
+    if layout is not None:
+        if isinstance(assignments, KernelFunction):
+            raise ValueError("layout can not be applied to an already created KernelFunction")
+        if is_stage_sequence(assignments):
+            assignments = [apply_layout(stage, layout) for stage in assignments]
+        else:
+            assignments = apply_layout(assignments, layout)
+        # the vectorizer assumes unit stride along x, which does not hold for 'zyxf' fields with index dimensions
+        stages = assignments if is_stage_sequence(assignments) else [assignments]
+        if layout == 'zyxf' and any(fa.field.index_dimensions > 0 for ac in stages for a in ac.all_assignments
+                                    for fa in a.atoms(Field.Access)):
+            create_kernel_params['cpu_vectorize_info']['instruction_set'] = None
+
+    if is_stage_sequence(assignments):
+        groups = fuse_stages(assignments)
+        if len(groups) > 1:
+            if create_kernel_params['target'] != 'cpu' or staggered or inner_outer_split:
+                raise ValueError("Stages that can not be fused per cell are only supported for non-staggered CPU "
+                                 "sweeps without inner_outer_split")
+            use_default_tiles = cache_blocking is True or not cache_blocking
+            tile_sizes = default_tile_sizes(groups[0]) if use_default_tiles else cache_blocking
+            generate_fused_sweep(generation_context, class_name, groups, namespace, field_swaps, varying_parameters,
+                                 storage_data_type, symbolic_optimizations, tile_sizes, create_kernel_params)
+            return
+        assignments = groups[0]
+
+    tile_sizes = OrderedDict()
+    if cache_blocking:
+        if create_kernel_params['target'] != 'cpu':
+            raise ValueError("cache_blocking is only supported for the 'cpu' target")
+        if isinstance(assignments, KernelFunction):
+            raise ValueError("cache_blocking can not be applied to an already created KernelFunction")
+        tile_sizes = default_tile_sizes(assignments) if cache_blocking is True else cache_blocking
+        tile_sizes = OrderedDict(zip(TILE_SIZE_NAMES, tile_sizes))
+        create_kernel_params['cpu_blocking'] = tuple(TypedSymbol(name, 'int64') for name in tile_sizes)
+
+    assignments = preprocess_assignments(assignments, class_name, field_swaps, storage_data_type,
+                                         symbolic_optimizations, create_kernel_params)
+
     if isinstance(assignments, KernelFunction):
         ast = assignments
         create_kernel_params['target'] = ast.target
@@ -64,32 +158,60 @@ def generate_sweep(generation_context, class_name, assignments,
     temporary_fields = tuple(e[1] for e in field_swaps)
 
     ast.function_name = class_name.lower()
+    flops_per_cell, bytes_per_cell = kernel_cost_per_cell(ast)
 
-    env = Environment(loader=PackageLoader('pystencils_walberla'), undefined=StrictUndefined)
-    add_pystencils_filters_to_jinja_env(env)
+    first_touch_kernel = None
+    if create_kernel_params['target'] == 'cpu' and create_kernel_params['cpu_openmp'] and not staggered \
+            and temporary_fields:
+        first_touch_ast = create_first_touch_kernel(ast, temporary_fields, create_kernel_params)
+        first_touch_ast.function_name = class_name.lower() + '_first_touch'
+        first_touch_kernel = KernelInfo(first_touch_ast, temporary_fields, field_swaps)
+
+    env = jinja_environment()
 
     if inner_outer_split is False:
+        kernel_info = KernelInfo(ast, temporary_fields, field_swaps, varying_parameters)
         jinja_context = {
-            'kernel': KernelInfo(ast, temporary_fields, field_swaps, varying_parameters),
+            'kernel': kernel_info,
             'namespace': namespace,
             'class_name': class_name,
             'target': create_kernel_params.get("target", "cpu"),
             'headers': get_headers(ast),
+            'field': representative_field(kernel_info),
+            'first_touch_kernel': first_touch_kernel,
+            'tile_sizes': tile_sizes,
+            'tile_size_names': tuple(tile_sizes),
+            'flops_per_cell': flops_per_cell,
+            'bytes_per_cell': bytes_per_cell,
         }
         header = env.get_template("Sweep.tmpl.h").render(**jinja_context)
         source = env.get_template("Sweep.tmpl.cpp").render(**jinja_context)
     else:
         main_kernel_info = KernelInfo(ast, temporary_fields, field_swaps, varying_parameters)
-        representative_field = {p.field_name for p in main_kernel_info.parameters if p.is_field_parameter}
-        representative_field = sorted(representative_field)[0]
+
+        # the outer slabs are distributed among threads as a whole, so each slab chunk runs a kernel without OpenMP
+        outer_kernel = None
+        if create_kernel_params['target'] == 'cpu' and create_kernel_params['cpu_openmp'] and \
+                not isinstance(assignments, KernelFunction):
+            outer_params = {k: v for k, v in create_kernel_params.items() if k != 'cpu_blocking'}
+            outer_params['cpu_openmp'] = False
+            outer_ast = (create_staggered_kernel if staggered else create_kernel)(assignments, **outer_params)
+            outer_ast.function_name = class_name.lower() + '_outer'
+            outer_kernel = KernelInfo(outer_ast, temporary_fields, field_swaps, varying_parameters)
 
         jinja_context = {
             'kernel': main_kernel_info,
+            'outer_kernel': outer_kernel,
             'namespace': namespace,
             'class_name': class_name,
             'target': create_kernel_params.get("target", "cpu"),
-            'field': representative_field,
+            'field': representative_field(main_kernel_info),
+            'first_touch_kernel': first_touch_kernel,
+            'tile_sizes': tile_sizes,
+            'tile_size_names': tuple(tile_sizes),
             'headers': get_headers(ast),
+            'flops_per_cell': flops_per_cell,
+            'bytes_per_cell': bytes_per_cell,
         }
         header = env.get_template("SweepInnerOuter.tmpl.h").render(**jinja_context)
         source = env.get_template("SweepInnerOuter.tmpl.cpp").render(**jinja_context)
@@ -101,7 +223,7 @@ def generate_sweep(generation_context, class_name, assignments,
 
 def generate_pack_info_for_field(generation_context, class_name: str, field: Field,
                                  direction_subset: Optional[Tuple[Tuple[int, int, int]]] = None,
-                                 **create_kernel_params):
+                                 storage_data_type=None, **create_kernel_params):
     """Creates a pack info for a pystencils field assuming a pull-type stencil, packing all cell elements.
 
     Args:
@@ -110,6 +232,7 @@ def generate_pack_info_for_field(generation_context, class_name: str, field: Fie
         field: pystencils field for which to generate pack info
         direction_subset: optional sequence of directions for which values should be packed
                           otherwise a D3Q27 stencil is assumed
+        storage_data_type: see documentation of `generate_sweep`
         **create_kernel_params: remaining keyword arguments are passed to `pystencils.create_kernel`
     """
     if not direction_subset:
@@ -117,11 +240,11 @@ def generate_pack_info_for_field(generation_context, class_name: str, field: Fie
 
     all_index_accesses = [field(*ind) for ind in product(*[range(s) for s in field.index_shape])]
     return generate_pack_info(generation_context, class_name, {direction_subset: all_index_accesses},
-                              **create_kernel_params)
+                              storage_data_type=storage_data_type, **create_kernel_params)
 
 
 def generate_pack_info_from_kernel(generation_context, class_name: str, assignments: Sequence[Assignment],
-                                   kind='pull', **create_kernel_params):
+                                   kind='pull', storage_data_type=None, **create_kernel_params):
     """Generates a waLBerla GPU PackInfo from a (pull) kernel.
 
     Args:
@@ -129,45 +252,48 @@ def generate_pack_info_from_kernel(generation_context, class_name: str, assignme
         class_name: name of the generated class
         assignments: list of assignments from the compute kernel - generates PackInfo for "pull" part only
                      i.e. the kernel is expected to only write to the center
-        kind:                      
+        kind: 'pull' if the kernel reads neighbor values, 'push' if it writes to neighbors
+        storage_data_type: see documentation of `generate_sweep`
         **create_kernel_params: remaining keyword arguments are passed to `pystencils.create_kernel`
     """
-    assert kind in ('push', 'pull')
-    reads = set()
-    writes = set()
+    spec = communication_spec(assignments, kind)
+    return generate_pack_info(generation_context, class_name, spec, storage_data_type=storage_data_type,
+                              **create_kernel_params)
 
-    if isinstance(assignments, AssignmentCollection):
-        assignments = assignments.all_assignments
 
-    for a in assignments:
-        if not isinstance(a, Assignment):
-            continue
-        reads.update(a.rhs.atoms(Field.Access))
-        writes.update(a.lhs.atoms(Field.Access))
-    spec = defaultdict(set)
-    if kind == 'pull':
-        for fa in reads:
-            assert all(abs(e) <= 1 for e in fa.offsets)
-            if all(offset == 0 for offset in fa.offsets):
-                continue
-            comm_direction = inverse_direction(fa.offsets)
-            for comm_dir in comm_directions(comm_direction):
-                spec[(comm_dir,)].add(fa.field.center(*fa.index))
-    elif kind == 'push':
-        for fa in writes:
-            assert all(abs(e) <= 1 for e in fa.offsets)
-            if all(offset == 0 for offset in fa.offsets):
-                continue
-            for comm_dir in comm_directions(fa.offsets):
-                spec[(comm_dir,)].add(fa)
-    else:
-        raise ValueError("Invalid 'kind' parameter")
-    return generate_pack_info(generation_context, class_name, spec, **create_kernel_params)
+def generate_pack_info_from_kernels(generation_context, class_name: str, kernels, storage_data_type=None,
+                                    communication_report=False, **create_kernel_params):
+    """Generates a waLBerla PackInfo for a sequence of kernels, that run between two communications.
+
+    Only the values that at least one of the kernels needs are communicated, for each direction separately.
+    Staggered kernels, i.e. assignments to staggered fields as passed to `pystencils.create_staggered_kernel`,
+    are supported for kind 'pull'.
+
+    Args:
+        generation_context: see documentation of `generate_sweep`
+        class_name: name of the generated class
+        kernels: sequence of (assignments, kind) pairs, kind is 'pull' or 'push',
+                 see `generate_pack_info_from_kernel`
+        storage_data_type: see documentation of `generate_sweep`
+        communication_report: if True, the bytes per cell communicated in each direction are logged with level INFO,
+                              compared to a pack info that sends all values of the fields in all directions
+        **create_kernel_params: remaining keyword arguments are passed to `pystencils.create_kernel`
+    """
+    spec = union_communication_spec(kernels)
+    if communication_report:
+        report_spec = spec
+        if storage_data_type is not None:
+            report_spec = {d: [access_with_storage_type(t, storage_data_type) for t in terms]
+                           for d, terms in spec.items()}
+        logger.info(format_communication_report(report_spec,
+                                                "Communication of '{}' in bytes per cell:".format(class_name)))
+    return generate_pack_info(generation_context, class_name, spec, storage_data_type=storage_data_type,
+                              **create_kernel_params)
 
 
 def generate_pack_info(generation_context, class_name: str,
                        directions_to_pack_terms: Dict[Tuple[Tuple], Sequence[Field.Access]],
-                       namespace='pystencils',
+                       namespace='pystencils', storage_data_type=None, batched=False, layout=None,
                        **create_kernel_params):
     """Generates a waLBerla GPU PackInfo
 
@@ -177,9 +303,33 @@ def generate_pack_info(generation_context, class_name: str,
         directions_to_pack_terms: maps tuples of directions to read field accesses, specifying which values have to be
                                   packed for which direction
         namespace: inner namespace of the generated class
+        storage_data_type: see documentation of `generate_sweep`, pack infos always transfer the storage type
+        batched: only for the 'gpu' target - additionally generates `packBatched` and `unpackBatched`, which pack
+                 or unpack a list of (block, direction) pairs into/from one contiguous buffer with a single kernel
+                 launch, instead of one launch per direction and block. The buffer holds the entries one after
+                 another. Within an entry the cells are ordered with x fastest, independent of the memory layout
+                 of the fields - this is the order in which pystencils GPU kernels, and thus `pack`, index buffers.
+                 The start and the values per cell of each entry are stored in a per-launch offset table, which
+                 is passed to the kernel by value.
+        layout: memory layout of the waLBerla fields, 'fzyx' or 'zyxf', see `generate_sweep`. The buffer then
+                follows the layout of the fields: for 'fzyx' all cells of the first packed value are followed by all
+                cells of the second value and so on, for 'zyxf' the values of one cell are stored together.
+                `pack` and `unpack` check once that the fields have this layout. Slices that consist of contiguous
+                x-rows of the fields are packed with memcpy instead of loop kernels on the 'cpu' target, see
+                `contiguous_copy`.
         **create_kernel_params: remaining keyword arguments are passed to `pystencils.create_kernel`
     """
-    items = [(e[0], sorted(e[1], key=lambda x: str(x))) for e in directions_to_pack_terms.items()]
+    if storage_data_type is not None:
+        directions_to_pack_terms = {d: [access_with_storage_type(t, storage_data_type) for t in terms]
+                                    for d, terms in directions_to_pack_terms.items()}
+    if layout is not None:
+        directions_to_pack_terms = {d: [access_with_layout(t, layout) for t in terms]
+                                    for d, terms in directions_to_pack_terms.items()}
+        # consecutive buffer entries are read from consecutive memory locations in 'zyxf' layout
+        items = [(e[0], sorted(e[1], key=lambda x: (x.field.name, x.index, x.offsets)))
+                 for e in directions_to_pack_terms.items()]
+    else:
+        items = [(e[0], sorted(e[1], key=lambda x: str(x))) for e in directions_to_pack_terms.items()]
     items = sorted(items, key=lambda e: e[0])
     directions_to_pack_terms = OrderedDict(items)
 
@@ -187,6 +337,11 @@ def generate_pack_info(generation_context, class_name: str,
     target = create_kernel_params.get('target', 'cpu')
 
     template_name = "CpuPackInfo.tmpl" if target == 'cpu' else 'GpuPackInfo.tmpl'
+    if layout == 'zyxf':
+        # the vectorizer assumes unit stride along x
+        create_kernel_params['cpu_vectorize_info']['instruction_set'] = None
+    if batched and target != 'gpu':
+        raise ValueError("Batched packing is only supported for the 'gpu' target")
 
     fields_accessed = set()
     for terms in directions_to_pack_terms.values():
@@ -208,13 +363,17 @@ def generate_pack_info(generation_context, class_name: str,
     unpack_kernels = OrderedDict()
     all_accesses = set()
     elements_per_cell = OrderedDict()
+    contiguous_copies = OrderedDict()
     for direction_set, terms in directions_to_pack_terms.items():
         for d in direction_set:
             if not all(abs(i) <= 1 for i in d):
                 raise NotImplementedError("Only first neighborhood supported")
 
-        buffer = Field.create_generic('buffer', spatial_dimensions=1, field_type=FieldType.BUFFER,
-                                      dtype=dtype.numpy_dtype, index_shape=(len(terms),))
+        if layout == 'fzyx':
+            buffer = dense_pack_buffer(terms[0].field, len(terms))
+        else:
+            buffer = Field.create_generic('buffer', spatial_dimensions=1, field_type=FieldType.BUFFER,
+                                          dtype=dtype.numpy_dtype, index_shape=(len(terms),))
 
         direction_strings = tuple(offset_to_direction_string(d) for d in direction_set)
         all_accesses.update(terms)
@@ -229,7 +388,12 @@ def generate_pack_info(generation_context, class_name: str,
         pack_kernels[direction_strings] = KernelInfo(pack_ast)
         unpack_kernels[direction_strings] = KernelInfo(unpack_ast)
         elements_per_cell[direction_strings] = len(terms)
+        copy = contiguous_copy(direction_set, terms, layout) if target == 'cpu' else None
+        if copy is not None:
+            contiguous_copies[direction_strings] = copy
 
+    # kernel touching all fields, only used to generate the class interface
+    buffer = Field.create_generic('buffer', spatial_dimensions=1, field_type=FieldType.BUFFER, dtype=dtype.numpy_dtype)
     fused_kernel = create_kernel([Assignment(buffer.center, t) for t in all_accesses], **create_kernel_params)
 
     jinja_context = {
@@ -238,14 +402,18 @@ def generate_pack_info(generation_context, class_name: str,
         'unpack_kernels': unpack_kernels,
         'fused_kernel': KernelInfo(fused_kernel),
         'elements_per_cell': elements_per_cell,
+        'contiguous_copies': contiguous_copies,
         'headers': get_headers(fused_kernel),
         'target': target,
         'dtype': dtype,
         'field_name': field_names.pop(),
         'namespace': namespace,
+        'batched': batched,
+        'buffer_layout': 'fzyx' if layout == 'fzyx' else 'zyxf',
     }
-    env = Environment(loader=PackageLoader('pystencils_walberla'), undefined=StrictUndefined)
-    add_pystencils_filters_to_jinja_env(env)
+    if batched:
+        jinja_context.update(batched_pack_context(directions_to_pack_terms))
+    env = jinja_environment()
     header = env.get_template(template_name + ".h").render(**jinja_context)
     source = env.get_template(template_name + ".cpp").render(**jinja_context)
 
@@ -254,6 +422,173 @@ def generate_pack_info(generation_context, class_name: str,
     generation_context.write_file("{}.{}".format(class_name, source_extension), source)
 
 
+def dense_pack_buffer(field, values_per_cell):
+    """Pack buffer in 'fzyx' layout, shaped like the packed slice of the field.
+
+    The buffer is a custom field: pystencils resolves the accesses with the strides given here, while the generated
+    kernel call passes the buffer pointer directly.
+    """
+    spatial_shape = field.spatial_shape
+    strides = [1]
+    for size in spatial_shape:
+        strides.append(strides[-1] * size)
+    return Field('buffer', FieldType.CUSTOM, field.dtype, tuple(reversed(range(field.spatial_dimensions))),
+                 tuple(spatial_shape) + (values_per_cell,), tuple(strides))
+
+
+def contiguous_copy(direction_set, terms, layout):
+    """Describes the packed values of the directions of a set, that can be copied as contiguous x-rows of the fields.
+
+    The slices of directions without x-component span the whole x-range of the interior. For these directions the
+    packed values of each (y, z) pair of the slice lie in contiguous memory: in 'fzyx' layout one row per packed
+    value, in 'zyxf' layout a single row of all values, if all values of one field are packed in index order. These
+    rows are copied with memcpy, into the same buffer positions the pack kernels would use. The other directions of
+    the set are packed by the kernels. Layout mismatches are reported by the layout checks at the top of
+    `pack` and `unpack`. Only strides the layout does not fix are checked before the copy, i.e. that the cells
+    of a 'zyxf' field are not padded, otherwise the kernels are called.
+
+    Returns:
+        None if no direction can be copied, otherwise a dict with the copied rows as (field name, index) pairs, the
+        number of values per cell in a row, the runtime condition for the copy (empty if the copy is always
+        possible), the names of the copied directions, and the names of the remaining directions of the set
+    """
+    copied = [d for d in direction_set if d[0] == 0]
+    if layout is None or not copied:
+        return None
+    if any(t.field.spatial_dimensions != 3 or any(t.offsets) for t in terms):
+        return None
+
+    if layout == 'fzyx':
+        rows = [(t.field.name, t.index[0] if t.index else 0) for t in terms]
+        values_per_cell = 1
+    else:
+        field = terms[0].field
+        all_indices = list(product(*[range(s) for s in field.index_shape]))
+        if any(t.field != field for t in terms) or [t.index for t in terms] != all_indices:
+            return None
+        rows = [(field.name, 0)]
+        values_per_cell = field.values_per_cell()
+
+    # the layout checks guarantee a unit x-stride in 'fzyx' and a unit f-stride in 'zyxf' layout
+    conditions = []
+    if values_per_cell > 1:
+        conditions.append("{}->xStride() == {}".format(rows[0][0], values_per_cell))
+    return {'rows': rows, 'values_per_cell': values_per_cell, 'condition': " && ".join(conditions),
+            'directions': tuple(offset_to_direction_string(d) for d in copied),
+            'kernel_directions': tuple(offset_to_direction_string(d) for d in direction_set if d[0] != 0)}
+
+
+def batched_pack_context(directions_to_pack_terms):
+    """Template variables for the single-launch pack and unpack kernels of batched GPU pack infos.
+
+    The batched kernels are written in the template: every thread handles one cell of one (block, direction) entry,
+    the entry is looked up in the offset table of the launch. The field accesses of each direction set are generated
+    here as C expressions, relative to the cell coordinates `x, y, z` and the field pointers `s._data_<field>` and
+    strides `s._stride_<field>_<coordinate>` of the entry `s`.
+    """
+    fields = sorted({t.field for terms in directions_to_pack_terms.values() for t in terms}, key=lambda f: f.name)
+    for f in fields:
+        if f.index_dimensions > 1:
+            raise NotImplementedError("Batched packing supports only fields with at most one index dimension")
+
+    def access_code(field_access):
+        name = field_access.field.name
+        coordinates = [c if o == 0 else "({} {} {})".format(c, '+' if o > 0 else '-', abs(o))
+                       for c, o in zip(('x', 'y', 'z'), field_access.offsets)]
+        coordinates += [str(i) for i in field_access.index]
+        index = " + ".join("{} * s._stride_{}_{}".format(c, name, i) for i, c in enumerate(coordinates) if c != '0')
+        return "s._data_{}[{}]".format(name, index)
+
+    batched_terms = OrderedDict()
+    for direction_set, terms in directions_to_pack_terms.items():
+        direction_strings = tuple(offset_to_direction_string(d) for d in direction_set)
+        batched_terms[direction_strings] = [access_code(t) for t in terms]
+
+    # kernel parameters are limited to 4KB, the offset table has to fit into that
+    bytes_per_entry = 8 * (10 + sum(1 + f.spatial_dimensions + f.index_dimensions for f in fields))
+    max_entries = (4000 - 16) // bytes_per_entry
+    if max_entries < 1:
+        raise NotImplementedError("Too many fields for batched packing")
+    return {
+        'batched_fields': [(f.name, f.spatial_dimensions + f.index_dimensions) for f in fields],
+        'batched_terms': batched_terms,
+        'max_batch_entries': max_entries,
+    }
+
+
+def generate_checkpoint(generation_context, class_name: str, fields: Sequence[Field], namespace='pystencils',
+                        checkpoint_data_type=None, compression=False, **create_kernel_params):
+    """Generates a class that writes the inner region of fields to contiguous per-block buffers and restores them.
+
+    The buffers are filled by generated pack kernels, such that checkpointing runs at close to memory bandwidth.
+    Besides `serialize` and `deserialize` for a single block, the generated class offers `save` and `load`, which
+    write and read all blocks of a process to/from one file per process. Restoring requires the same domain
+    decomposition and number of processes.
+
+    Args:
+        generation_context: see documentation of `generate_sweep`
+        class_name: name of the generated class
+        fields: pystencils fields to checkpoint, all cell values of the inner region are stored
+        namespace: inner namespace of the generated class
+        checkpoint_data_type: data type of the stored values. A narrower type than the field type, e.g. 'float32' for
+                              'float64' fields, halves the checkpoint size at the cost of precision. The pack
+                              kernels are not vectorized if the types differ. Defaults to the field type.
+        compression: if True, buffers are compressed with a lightweight scheme: the bytes of all values are
+                     regrouped by their significance (byte shuffle), then runs of equal bytes are encoded
+                     (PackBits run-length encoding). This mainly compresses sign and exponent bytes.
+        **create_kernel_params: remaining keyword arguments are passed to `pystencils.create_kernel`
+    """
+    create_kernel_params = default_create_kernel_parameters(generation_context, create_kernel_params)
+    if create_kernel_params['target'] != 'cpu':
+        raise ValueError("Checkpoints are only supported for the 'cpu' target")
+
+    fields = sorted(fields, key=lambda f: f.name)
+    if not fields:
+        raise ValueError("No fields to checkpoint!")
+    if checkpoint_data_type is None:
+        data_types = {f.dtype for f in fields}
+        if len(data_types) != 1:
+            err_detail = "\n".join(" - {} [{}]".format(f.name, f.dtype) for f in fields)
+            raise NotImplementedError("Fields of different data types are used - this is not supported, "
+                                      "specify a checkpoint_data_type.\n" + err_detail)
+        dtype = data_types.pop()
+    else:
+        dtype = create_type(checkpoint_data_type)
+    if any(f.dtype != dtype for f in fields):
+        # the vectorizer does not support kernels converting between types
+        create_kernel_params['cpu_vectorize_info'] = dict(create_kernel_params['cpu_vectorize_info'],
+                                                          instruction_set=None)
+
+    terms = [f(*idx) for f in fields for idx in product(*[range(s) for s in f.index_shape])]
+    buffer = Field.create_generic('buffer', spatial_dimensions=1, field_type=FieldType.BUFFER,
+                                  dtype=dtype.numpy_dtype, index_shape=(len(terms),))
+
+    pack_ast = create_kernel([Assignment(buffer(i), t) for i, t in enumerate(terms)],
+                             **create_kernel_params, ghost_layers=0)
+    pack_ast.function_name = 'pack_{}'.format(class_name.lower())
+    unpack_ast = create_kernel([Assignment(t, buffer(i)) for i, t in enumerate(terms)],
+                               **create_kernel_params, ghost_layers=0)
+    unpack_ast.function_name = 'unpack_{}'.format(class_name.lower())
+
+    jinja_context = {
+        'class_name': class_name,
+        'pack_kernel': KernelInfo(pack_ast),
+        'unpack_kernel': KernelInfo(unpack_ast),
+        'elements_per_cell': len(terms),
+        'headers': get_headers(pack_ast),
+        'target': 'cpu',
+        'dtype': dtype,
+        'field_name': fields[0].name,
+        'compression': compression,
+        'namespace': namespace,
+    }
+    env = jinja_environment()
+    header = env.get_template("Checkpoint.tmpl.h").render(**jinja_context)
+    source = env.get_template("Checkpoint.tmpl.cpp").render(**jinja_context)
+    generation_context.write_file("{}.h".format(class_name), header)
+    generation_context.write_file("{}.cpp".format(class_name), source)
+
+
 def generate_mpidtype_info_from_kernel(generation_context, class_name: str,
                                        assignments: Sequence[Assignment], kind='pull', namespace='pystencils', ):
     assert kind in ('push', 'pull')
@@ -305,11 +640,84 @@ def generate_mpidtype_info_from_kernel(generation_context, class_name: str,
         'f_size': field.index_shape[0],
         'spec': spec,
     }
-    env = Environment(loader=PackageLoader('pystencils_walberla'), undefined=StrictUndefined)
+    env = jinja_environment()
     header = env.get_template("MpiDtypeInfo.tmpl.h").render(**jinja_context)
     generation_context.write_file("{}.h".format(class_name), header)
 
 
+def generate_block_weights(generation_context, class_name: str, sweep_class_names: Sequence[str],
+                           namespace='pystencils'):
+    """Generates a helper that sums the cost estimates of several generated sweeps to block weights.
+
+    The weights can be used for dynamic load balancing, see the generated header for usage. Each sweep only
+    contributes on blocks where its field is allocated, and the generated `setSelectors` restricts a sweep to blocks
+    by their state, such that blocks running different sweeps get different weights.
+
+    Args:
+        generation_context: see documentation of `generate_sweep`
+        class_name: name of the generated class
+        sweep_class_names: names of sweep classes generated with `generate_sweep` that make up one time step.
+                           The generated class expects a shared pointer to each of them in its constructor.
+        namespace: inner namespace of the generated class, has to be the namespace of the sweeps
+    """
+    if not sweep_class_names:
+        raise ValueError("At least one sweep class is required")
+    jinja_context = {
+        'class_name': class_name,
+        'namespace': namespace,
+        'sweeps': tuple(sweep_class_names),
+    }
+    env = jinja_environment()
+    header = env.get_template("BlockWeights.tmpl.h").render(**jinja_context)
+    generation_context.write_file("{}.h".format(class_name), header)
+
+
+def generate_communication_hiding_timestep(generation_context, class_name: str, sweep_class_name: str,
+                                           pack_info_class_name: str, stencil='D3Q27', target='cpu',
+                                           concurrent_outer_slabs=True, log_hidden_time=False,
+                                           namespace='pystencils'):
+    """Generates a class that runs one time step of a sweep while hiding the ghost layer communication.
+
+    The generated class starts the non-blocking communication, runs `inner()` of the sweep on all blocks, waits for
+    the communication to finish (which unpacks the received data) and then runs `outer()`, which also swaps fields.
+
+    Args:
+        generation_context: see documentation of `generate_sweep`
+        class_name: name of the generated class
+        sweep_class_name: name of a sweep class generated with `generate_sweep` and `inner_outer_split=True`
+        pack_info_class_name: name of the pack info class for the communication, e.g. generated with
+                              `generate_pack_info_from_kernel`
+        stencil: name of the waLBerla stencil of the communication scheme, e.g. D3Q19 or D3Q27
+        target: 'cpu' or 'gpu', has to match target of sweep and pack info
+        concurrent_outer_slabs: if True the six outer slabs of a block are updated concurrently, otherwise one after
+                                another, see `setOuterSlabsConcurrent` of the sweep. On GPU the slabs run on
+                                parallel streams, on CPU with OpenMP they are distributed among the threads in one
+                                parallel region instead of parallelizing each slab separately.
+        log_hidden_time: if True, the phases are timed and the generated class gets a `logHiddenCommunicationTime`
+                         method. It measures the duration of the communication alone with a few blocking exchanges
+                         and reports which part of it was hidden behind the inner update
+        namespace: inner namespace of the generated class, has to be the namespace of sweep and pack info
+    """
+    if target not in ('cpu', 'gpu'):
+        raise ValueError("Invalid target '{}'".format(target))
+    if not generation_context.cuda and target == 'gpu':
+        return
+
+    jinja_context = {
+        'class_name': class_name,
+        'namespace': namespace,
+        'sweep': sweep_class_name,
+        'pack_info': pack_info_class_name,
+        'stencil': stencil,
+        'target': target,
+        'concurrent_outer_slabs': concurrent_outer_slabs,
+        'log_hidden_time': log_hidden_time,
+    }
+    env = jinja_environment()
+    header = env.get_template("CommunicationHidingTimestep.tmpl.h").render(**jinja_context)
+    generation_context.write_file("{}.h".format(class_name), header)
+
+
 # ---------------------------------- Internal --------------------------------------------------------------------------
 
 
@@ -322,13 +730,306 @@ class KernelInfo:
         self.parameters = ast.get_parameters()  # cache parameters here
 
 
+def field_with_storage_type(field, storage_data_type):
+    """Returns a copy of the field, stored in the given type.
+
+    storage_data_type may be a single type for all fields, or a dict mapping fields or field names to types.
+    """
+    if isinstance(storage_data_type, dict):
+        types_by_name = {(k.name if isinstance(k, Field) else k): v for k, v in storage_data_type.items()}
+        if field.name not in types_by_name:
+            return field
+        storage_data_type = types_by_name[field.name]
+    if create_type(storage_data_type) == field.dtype:
+        return field
+    return Field(field.name, field.field_type, storage_data_type, field.layout, field.shape, field.strides)
+
+
+LAYOUTS = ('fzyx', 'zyxf')
+
+
+def field_with_layout(field, layout):
+    """Returns a copy of the field with the given waLBerla memory layout and unit stride of the fastest coordinate.
+
+    Fields without index dimensions are stored in the same way in both layouts, with x as fastest coordinate.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError("Unknown layout '{}', use one of {}".format(layout, LAYOUTS))
+    if field.index_dimensions > 1:
+        raise NotImplementedError("Layouts can only be chosen for fields with at most one index dimension")
+    if field.index_dimensions == 0:
+        full_layout = tuple(reversed(range(field.spatial_dimensions)))
+    else:
+        full_layout = layout_string_to_tuple(layout, field.spatial_dimensions + 1)
+    strides = list(field.strides)
+    strides[full_layout[-1]] = 1
+    spatial_layout = tuple(c for c in full_layout if c < field.spatial_dimensions)
+    return Field(field.name, field.field_type, field.dtype, spatial_layout, field.shape, tuple(strides))
+
+
+def access_with_layout(field_access, layout):
+    field = field_with_layout(field_access.field, layout)
+    return Field.Access(field, field_access.offsets, field_access.index, field_access.is_absolute_access)
+
+
+def apply_layout(assignments, layout):
+    """Substitutes all fields in the assignments by fields with the given layout, see `field_with_layout`."""
+    if not isinstance(assignments, AssignmentCollection):
+        assignments = AssignmentCollection(list(assignments))
+    accesses = set()
+    for a in assignments.all_assignments:
+        accesses.update(a.atoms(Field.Access))
+    substitutions = {fa: access_with_layout(fa, layout) for fa in accesses}
+    return assignments.new_with_substitutions(substitutions, substitute_on_lhs=True)
+
+
+def access_with_storage_type(field_access, storage_data_type):
+    field = field_with_storage_type(field_access.field, storage_data_type)
+    if field is field_access.field:
+        return field_access
+    return Field.Access(field, field_access.offsets, field_access.index, field_access.is_absolute_access)
+
+
+def apply_storage_data_types(assignments, storage_data_type, field_swaps, create_kernel_params):
+    """Substitutes all fields in the assignments by fields stored in the requested storage types.
+
+    If storage and compute type differ, all field reads are moved to subexpressions such that they are converted to
+    the compute type before any arithmetic is done. Vectorization is switched off in this case, since the
+    vectorizer does not support mixed types.
+    """
+    if isinstance(storage_data_type, dict):
+        storage_data_type = {(k.name if isinstance(k, Field) else k): v for k, v in storage_data_type.items()}
+        for main_field, tmp_field in field_swaps:
+            main_name, tmp_name = (f.name if isinstance(f, Field) else f for f in (main_field, tmp_field))
+            if main_name in storage_data_type and tmp_name not in storage_data_type:
+                storage_data_type[tmp_name] = storage_data_type[main_name]
+
+    if not isinstance(assignments, AssignmentCollection):
+        assignments = AssignmentCollection(list(assignments))
+
+    accesses = set()
+    for a in assignments.all_assignments:
+        accesses.update(a.atoms(Field.Access))
+    substitutions = {fa: access_with_storage_type(fa, storage_data_type) for fa in accesses}
+    substitutions = {k: v for k, v in substitutions.items() if k is not v}
+    if not substitutions:
+        return assignments
+
+    assignments = assignments.new_with_substitutions(substitutions, substitute_on_lhs=True)
+
+    compute_type = create_type(create_kernel_params['data_type'])
+    if all(fa.field.dtype == compute_type for fa in substitutions.values()):
+        return assignments
+
+    reads = set()
+    used_names = set()
+    for a in assignments.all_assignments:
+        reads.update(a.rhs.atoms(Field.Access))
+        used_names.update(s.name for s in a.atoms(sp.Symbol))
+    symbol_names = (s.name for s in assignments.subexpression_symbol_generator if s.name not in used_names)
+    loads = {fa: TypedSymbol(next(symbol_names), compute_type) for fa in sorted(reads, key=str)}
+    create_kernel_params['cpu_vectorize_info'] = dict(create_kernel_params['cpu_vectorize_info'], instruction_set=None)
+    return assignments.new_with_substitutions(loads, add_substitutions_as_subexpressions=True,
+                                              substitute_on_lhs=False)
+
+
+def preprocess_assignments(assignments, name, field_swaps, storage_data_type, symbolic_optimizations,
+                           create_kernel_params):
+    """Applies storage data types and symbolic optimizations of `generate_sweep` to the assignments."""
+    if storage_data_type is not None:
+        if isinstance(assignments, KernelFunction):
+            raise ValueError("storage_data_type can not be used together with an already created KernelFunction")
+        assignments = apply_storage_data_types(assignments, storage_data_type, field_swaps, create_kernel_params)
+
+    if symbolic_optimizations:
+        if isinstance(assignments, KernelFunction):
+            raise ValueError("symbolic_optimizations can not be applied to an already created KernelFunction")
+        stages = STAGES.keys() if symbolic_optimizations is True else symbolic_optimizations
+        assignments, report = optimize_assignments(assignments, stages)
+        logger.info(format_operation_count_report(report, "Operations per cell of '{}':".format(name)))
+    return assignments
+
+
+def is_stage_sequence(assignments):
+    return isinstance(assignments, (list, tuple)) and len(assignments) > 0 and \
+        all(isinstance(a, (AssignmentCollection, list, tuple)) for a in assignments)
+
+
+def generate_fused_sweep(generation_context, class_name, groups, namespace, field_swaps, varying_parameters,
+                         storage_data_type, symbolic_optimizations, tile_sizes, create_kernel_params):
+    """Generates a sweep running the given stage groups one after another with overlapped tile temporal blocking.
+
+    The tiles of one color (parity of the tile index) are distributed among the OpenMP threads, the colors run one
+    after another. The stage kernels themselves are created without OpenMP.
+    The 'ghost_layers' parameter of `create_kernel_params` is interpreted as the number of ghost layers of the
+    waLBerla fields, the tiles define the iteration region of the stage kernels.
+    """
+    check_temporal_blocking(groups)
+
+    create_kernel_params = dict(create_kernel_params)
+    field_ghost_layers = create_kernel_params.pop('ghost_layers', None)
+    ghost_layers = required_ghost_layers(groups)
+    if isinstance(field_ghost_layers, int):
+        too_few = sorted(name for name, n in ghost_layers.items() if n > field_ghost_layers)
+        if too_few:
+            raise ValueError("Fields {} need {} ghost layers for the overlapped tiles of '{}', but only {} are "
+                             "available".format(too_few, max(ghost_layers[n] for n in too_few), class_name,
+                                                field_ghost_layers))
+    openmp = create_kernel_params['cpu_openmp']
+    stage_kernel_params = dict(create_kernel_params, cpu_openmp=False)
+
+    field_swaps = tuple(tuple(f.name if isinstance(f, Field) else f for f in swap) for swap in field_swaps)
+    temporary_fields = tuple(e[1] for e in field_swaps)
+
+    stages = []
+    for i, (group, overlap) in enumerate(zip(groups, overlap_widths(groups))):
+        name = '{}_stage{}'.format(class_name.lower(), i)
+        group = preprocess_assignments(group, name, field_swaps, storage_data_type, symbolic_optimizations,
+                                       stage_kernel_params)
+        ast = create_kernel(group, **stage_kernel_params)
+        ast.function_name = name
+        stages.append((KernelInfo(ast, temporary_fields, field_swaps), overlap))
+
+    # kernel touching all fields and parameters of all stages, only used to generate the class interface
+    fields = sorted({f for kernel_info, _ in stages for f in kernel_info.ast.fields_accessed}, key=lambda f: f.name)
+    parameters = sorted({p.symbol for kernel_info, _ in stages for p in kernel_info.parameters
+                         if not p.is_field_parameter}, key=lambda s: s.name)
+    interface_kernel = create_kernel([Assignment(f(*(0,) * len(f.index_shape)), sp.Add(*parameters)) for f in fields],
+                                     **create_kernel_params)
+    kernel_info = KernelInfo(interface_kernel, temporary_fields, field_swaps, varying_parameters)
+
+    costs = [kernel_cost_per_cell(stage.ast) for stage, _ in stages]
+    jinja_context = {
+        'kernel': kernel_info,
+        'stages': stages,
+        'namespace': namespace,
+        'class_name': class_name,
+        'target': 'cpu',
+        'headers': sorted(set().union(*(get_headers(stage.ast) for stage, _ in stages))),
+        'field': representative_field(kernel_info),
+        'spatial_dimensions': fields[0].spatial_dimensions,
+        'tile_sizes': OrderedDict(zip(TILE_SIZE_NAMES, tile_sizes)),
+        'openmp': openmp,
+        'ghost_layers': OrderedDict(sorted((name, n) for name, n in ghost_layers.items() if n > 0)),
+        'flops_per_cell': sum(c[0] for c in costs),
+        'bytes_per_cell': sum(c[1] for c in costs),
+    }
+    env = jinja_environment()
+    header = env.get_template("FusedSweep.tmpl.h").render(**jinja_context)
+    source = env.get_template("FusedSweep.tmpl.cpp").render(**jinja_context)
+    generation_context.write_file("{}.h".format(class_name), header)
+    generation_context.write_file("{}.cpp".format(class_name), source)
+
+
+def create_first_touch_kernel(ast, field_names, create_kernel_params):
+    """Creates a kernel writing zeros to the given fields of the given kernel, iterating exactly like the kernel.
+
+    Ghost layers are not written, since iterating over them would change the distribution of the cells among the
+    threads.
+    """
+    fields = sorted((f for f in ast.fields_accessed if f.name in field_names), key=lambda f: f.name)
+    assignments = [Assignment(f(*idx), 0) for f in fields for idx in product(*[range(s) for s in f.index_shape])]
+    params = dict(create_kernel_params, ghost_layers=ast.ghost_layers)
+    return create_kernel(assignments, **params)
+
+
+TILE_SIZE_NAMES = ('tileSizeX', 'tileSizeY', 'tileSizeZ')
+
+
+def default_tile_sizes(assignments):
+    """Tiles that are long along the fastest coordinate, such that vectorized inner loops stay long."""
+    if isinstance(assignments, AssignmentCollection):
+        assignments = assignments.all_assignments
+    fields = {fa.field for a in assignments for fa in a.atoms(Field.Access)}
+    field = sorted(fields, key=lambda f: f.name)[0]
+    fastest_coordinate = [c for c in field.layout if c < field.spatial_dimensions][-1]
+    return tuple(256 if c == fastest_coordinate else 16 for c in range(field.spatial_dimensions))
+
+
+def representative_field(kernel_info):
+    """Name of a non-temporary field of the kernel, that defines the size of the iteration space."""
+    field_names = {p.field_name for p in kernel_info.parameters if p.is_field_parameter}
+    return sorted(field_names - set(kernel_info.temporary_fields))[0]
+
+
+def kernel_cost_per_cell(ast):
+    """Estimates floating point operations and bytes of memory traffic per cell of the iteration space.
+
+    Operations are counted in the innermost loop body (in the whole kernel for GPU kernels). For the memory traffic
+    each accessed (field, index) pair is counted once, i.e. perfect reuse of neighbor values is assumed.
+    """
+    bodies = [loop.body for loop in ast.atoms(LoopOverCoordinate) if loop.is_innermost_loop] or [ast.body]
+    estimates = []
+    for body in bodies:
+        flops = sum(count_floating_point_operations(a.rhs) for a in body.atoms(SympyAssignment)
+                    if is_floating_point_assignment(a))
+        accesses = {(fa.field.name, fa.idx_coordinate_values): fa.field.dtype.numpy_dtype.itemsize
+                    for fa in body.atoms(ResolvedFieldAccess)}
+        estimates.append((flops, sum(accesses.values())))
+    return max(estimates)
+
+
+def is_floating_point_assignment(assignment):
+    """False for assignments of pointers and integers, e.g. base pointers and thread indices of GPU kernels."""
+    dtype = getattr(assignment.lhs, 'dtype', None)
+    return dtype is None or (not isinstance(dtype, PointerType) and get_base_type(dtype).is_float())
+
+
+def count_floating_point_operations(expr):
+    """Counts additions, multiplications, divisions and square roots of an expression of a typed kernel.
+
+    The counting rules are those of `pystencils.sympyextensions.count_operations`, but the expression tree is only
+    inspected structurally: the expression is not evaluated numerically and no sympy assumptions or types are
+    queried, which is much faster for large kernels. Numeric subterms are counted as constants, field accesses as
+    loads, integer index computations inside field accesses are not counted.
+    """
+    if isinstance(expr, (sp.Symbol, sp.Indexed)) or expr.is_number:
+        return 0
+    if isinstance(expr, cast_func):
+        return count_floating_point_operations(expr.args[0])
+    if isinstance(expr, sp.Piecewise):
+        return sum(count_floating_point_operations(e) for e, _ in expr.args)
+    if isinstance(expr, sp.Rel):
+        return 0
+
+    operations = 0
+    if expr.func is sp.Add:
+        operations = len(expr.args) - 1
+    elif expr.func is sp.Mul:
+        operations = len([a for a in expr.args if a not in (sp.S.One, sp.S.NegativeOne)]) - 1
+    elif expr.func is sp.Pow:
+        exponent = expr.exp
+        if isinstance(exponent, sp.Integer):
+            # the division of x**-n replaces the multiplication by the power in the enclosing product
+            operations = abs(int(exponent)) - 1
+        elif isinstance(exponent, sp.Rational) and abs(exponent) == sp.Rational(1, 2):
+            operations = 1
+        return operations + count_floating_point_operations(expr.base)
+    return operations + sum(count_floating_point_operations(a) for a in expr.args)
+
+
+@lru_cache(maxsize=None)
+def jinja_environment():
+    """Jinja environment shared by all generation functions, compiled templates are cached on disk."""
+    env = Environment(loader=PackageLoader('pystencils_walberla'), undefined=StrictUndefined,
+                      bytecode_cache=FileSystemBytecodeCache())
+    add_pystencils_filters_to_jinja_env(env)
+    return env
+
+
+@lru_cache(maxsize=None)
+def supported_instruction_sets():
+    """Hardware detection is done once per process."""
+    return tuple(get_supported_instruction_sets() or ())
+
+
 def default_create_kernel_parameters(generation_context, params):
     default_dtype = "float64" if generation_context.double_accuracy else 'float32'
 
     if generation_context.optimize_for_localhost:
-        supported_instruction_sets = get_supported_instruction_sets()
-        if supported_instruction_sets:
-            default_vec_is = get_supported_instruction_sets()[-1]
+        instruction_sets = supported_instruction_sets()
+        if instruction_sets:
+            default_vec_is = instruction_sets[-1]
         else:  # if cpuinfo package is not installed
             default_vec_is = 'sse'
     else:
@@ -337,7 +1038,8 @@ def default_create_kernel_parameters(generation_context, params):
     params['target'] = params.get('target', 'cpu')
     params['data_type'] = params.get('data_type', default_dtype)
     params['cpu_openmp'] = params.get('cpu_openmp', generation_context.openmp)
-    params['cpu_vectorize_info'] = params.get('cpu_vectorize_info', {})
+    # copied, such that adaptions for one kernel do not leak into later calls reusing the caller's dict
+    params['cpu_vectorize_info'] = dict(params.get('cpu_vectorize_info') or {})
 
     vec = params['cpu_vectorize_info']
     vec['instruction_set'] = vec.get('instruction_set', default_vec_is)
@@ -345,26 +1047,3 @@ def default_create_kernel_parameters(generation_context, params):
     vec['assume_aligned'] = vec.get('assume_aligned', False)
     vec['nontemporal'] = vec.get('nontemporal', False)
     return params
-
-
-def comm_directions(direction):
-    if all(e == 0 for e in direction):
-        yield direction
-    binary_numbers_list = binary_numbers(len(direction))
-    for comm_direction in binary_numbers_list:
-        for i in range(len(direction)):
-            if direction[i] == 0:
-                comm_direction[i] = 0
-            if direction[i] == -1 and comm_direction[i] == 1:
-                comm_direction[i] = -1
-        if not all(e == 0 for e in comm_direction):
-            yield tuple(comm_direction)
-
-
-def binary_numbers(n):
-    result = list()
-    for i in range(1 << n):
-        binary_number = bin(i)[2:]
-        binary_number = '0' * (n - len(binary_number)) + binary_number
-        result.append((list(map(int, binary_number))))
-    return result
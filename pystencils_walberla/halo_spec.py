@@ -0,0 +1,212 @@
+"""
+Communication specifications for pack infos: which field values have to be sent in which direction.
+
+A kernel of kind 'pull' reads neighbor values, these have to be received into the ghost layers before the kernel
+runs. A kernel of kind 'push' writes to neighbor cells, the values written to the ghost layers have to be sent to the
+neighbor afterwards.
+
+Staggered kernels (see `pystencils.create_staggered_kernel`) store the value of a face at one of the two adjacent
+cells. Faces on the upper boundary of a block are stored in ghost cells, so the kernel also runs on these ghost cells,
+and reads that are at the center for interior cells reach into the neighbor block.
+
+Specifications map tuples of directions to sets of field accesses, the format of `generate_pack_info`.
+"""
+from collections import defaultdict
+from itertools import product
+
+from pystencils import Assignment, AssignmentCollection, Field, FieldType
+from pystencils.stencil import direction_string_to_offset, inverse_direction, offset_to_direction_string
+
+__all__ = ['communication_spec', 'union_communication_spec', 'format_communication_report']
+
+
+def comm_directions(direction):
+    if all(e == 0 for e in direction):
+        yield direction
+    binary_numbers_list = binary_numbers(len(direction))
+    for comm_direction in binary_numbers_list:
+        for i in range(len(direction)):
+            if direction[i] == 0:
+                comm_direction[i] = 0
+            if direction[i] == -1 and comm_direction[i] == 1:
+                comm_direction[i] = -1
+        if not all(e == 0 for e in comm_direction):
+            yield tuple(comm_direction)
+
+
+def binary_numbers(n):
+    result = list()
+    for i in range(1 << n):
+        binary_number = bin(i)[2:]
+        binary_number = '0' * (n - len(binary_number)) + binary_number
+        result.append((list(map(int, binary_number))))
+    return result
+
+
+def is_staggered_assignment(assignment):
+    return isinstance(assignment, Assignment) and type(assignment.lhs) is Field.Access and \
+        FieldType.is_staggered(assignment.lhs.field)
+
+
+def staggered_shifts(assignment):
+    """Cells relative to the interior, on which the face value of a staggered assignment is computed.
+
+    The face in direction d is stored at the cell, which has the face on its lower side. The faces on the other side
+    of the block are stored in the ghost layer at -d.
+    """
+    direction = direction_string_to_offset(assignment.lhs.field.staggered_stencil[assignment.lhs.index[0]],
+                                           assignment.lhs.field.spatial_dimensions)
+    return set(product(*[(0, -int(d)) if d else (0,) for d in direction]))
+
+
+def shifted_accesses(assignments):
+    """Yields (assignment, shift) pairs, the shift is one of the ghost cells next to the interior, on which the
+    assignment is executed, or None for kernels without staggered assignments.
+
+    Subexpressions and non-staggered assignments of a staggered kernel are executed on the union of the cells of all
+    staggered assignments.
+    """
+    if isinstance(assignments, AssignmentCollection):
+        assignments = assignments.all_assignments
+    assignments = [a for a in assignments if isinstance(a, Assignment)]
+
+    staggered = [a for a in assignments if is_staggered_assignment(a)]
+    if not staggered:
+        for a in assignments:
+            yield a, None
+        return
+
+    union = set().union(*[staggered_shifts(a) for a in staggered])
+    for a in assignments:
+        for shift in staggered_shifts(a) if is_staggered_assignment(a) else union:
+            yield a, shift
+
+
+def communicated_accesses(assignments, kind):
+    """Yields (field access, offsets) pairs of all values, that have to be communicated for a kernel.
+
+    The offsets are the position of the value relative to an interior cell. For kind 'pull' the field access is
+    the center access of the read value, for kind 'push' it is the write access itself.
+    """
+    if kind == 'pull':
+        for a, shift in shifted_accesses(assignments):
+            for fa in a.rhs.atoms(Field.Access):
+                offsets = effective_offsets(fa, shift)
+                if any(offsets):
+                    yield fa.field.center(*fa.index), offsets
+    elif kind == 'push':
+        for a, shift in shifted_accesses(assignments):
+            if shift is not None:
+                raise NotImplementedError("Staggered kernels are only supported with kind 'pull'")
+            for fa in a.lhs.atoms(Field.Access):
+                offsets = effective_offsets(fa, shift)
+                if any(offsets):
+                    yield fa, offsets
+    else:
+        raise ValueError("Invalid 'kind' parameter")
+
+
+def effective_offsets(field_access, shift):
+    offsets = tuple(int(o) for o in field_access.offsets)
+    if shift is not None:
+        offsets = tuple(o + s for o, s in zip(offsets, shift))
+    if not all(abs(o) <= 1 for o in offsets):
+        raise NotImplementedError("Only first neighborhood supported")
+    return offsets
+
+
+def communication_directions(offsets, kind):
+    return comm_directions(inverse_direction(offsets) if kind == 'pull' else offsets)
+
+
+def communication_spec(assignments, kind='pull'):
+    """Directions and values, that a single kernel needs to be communicated.
+
+    Args:
+        assignments: assignments or assignment collection of the kernel, may contain staggered assignments
+        kind: 'pull' if the kernel reads neighbor values, 'push' if it writes to neighbors
+
+    Returns:
+        dict mapping 1-tuples of directions to sets of field accesses
+    """
+    spec = defaultdict(set)
+    for term, offsets in communicated_accesses(assignments, kind):
+        for comm_dir in communication_directions(offsets, kind):
+            spec[(comm_dir,)].add(term)
+    return spec
+
+
+def written_values(assignments):
+    """Values written by a kernel, as (field name, index) pairs, and the subset written to ghost layers by staggered
+    kernels, as (field name, index, shift) triples."""
+    interior, ghost_layers = set(), set()
+    for a, shift in shifted_accesses(assignments):
+        for fa in a.lhs.atoms(Field.Access):
+            interior.add((fa.field.name, fa.index))
+            if shift is not None and any(shift):
+                ghost_layers.add((fa.field.name, fa.index, shift))
+    return interior, ghost_layers
+
+
+def union_communication_spec(kernels):
+    """Minimal specification for a sequence of kernels, that run between two communications.
+
+    Values that an earlier kernel of the sequence computes in the ghost layers (staggered kernels) are not
+    communicated. Directions that need the same values are grouped, such that they share pack and unpack kernels.
+
+    Args:
+        kernels: sequence of (assignments, kind) pairs, see `communication_spec`
+
+    Returns:
+        dict mapping tuples of directions to sets of field accesses
+    """
+    union = defaultdict(set)
+    written, written_to_ghost_layers = set(), set()
+    for i, (assignments, kind) in enumerate(kernels):
+        for term, offsets in communicated_accesses(assignments, kind):
+            value = (term.field.name, term.index)
+            if kind == 'pull' and value in written:
+                if value + (offsets,) in written_to_ghost_layers:
+                    continue
+                raise ValueError("Kernel {} reads '{}' at offset {}, which is written by an earlier kernel of the "
+                                 "sequence - this requires a communication in between".format(i, term, offsets))
+            for comm_dir in communication_directions(offsets, kind):
+                union[comm_dir].add(term)
+        interior, ghost_layers = written_values(assignments)
+        written.update(interior)
+        written_to_ghost_layers.update(ghost_layers)
+
+    directions_of_terms = defaultdict(list)
+    for direction, terms in union.items():
+        directions_of_terms[frozenset(terms)].append(direction)
+    return {tuple(sorted(directions)): set(terms) for terms, directions in directions_of_terms.items()}
+
+
+def format_communication_report(spec, title=""):
+    """Bytes per cell that are communicated in each direction, compared to packing all values of the fields.
+
+    Args:
+        spec: dict mapping tuples of directions to field accesses, as passed to `generate_pack_info`
+        title: first line of the report
+    """
+    bytes_per_direction = defaultdict(int)
+    fields = set()
+    for directions, terms in spec.items():
+        for direction in directions:
+            bytes_per_direction[direction] += sum(t.field.dtype.numpy_dtype.itemsize for t in terms)
+        fields.update(t.field for t in terms)
+
+    full_bytes = sum(f.dtype.numpy_dtype.itemsize * f.values_per_cell() for f in fields)
+    dim = max((f.spatial_dimensions for f in fields), default=3)
+    all_directions = [d for d in product(*[(-1, 0, 1)] * dim) if any(d)]
+    all_directions.sort(key=lambda d: (sum(abs(e) for e in d), offset_to_direction_string(d)))
+
+    lines = [title] if title else []
+    lines.append("    {:<10}{:>10}{:>10}".format("direction", "minimal", "full"))
+    for d in all_directions:
+        lines.append("    {:<10}{:>10}{:>10}".format(offset_to_direction_string(d), bytes_per_direction[d], full_bytes))
+    total = sum(bytes_per_direction[d] for d in all_directions)
+    full_total = full_bytes * len(all_directions)
+    ratio = "{:.1f}%".format(100 * total / full_total) if full_total else "-"
+    lines.append("    {:<10}{:>10}{:>10}  ({} of full)".format("total", total, full_total, ratio))
+    return "\n".join(lines)
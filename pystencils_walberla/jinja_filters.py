@@ -57,11 +57,10 @@ def get_field_fsize(field):
         return prod(field.index_shape)
 
 
-def get_field_stride(param):
-    field = param.fields[0]
-    type_str = get_base_type(param.symbol.dtype).base_name
+def get_field_strides(field, field_name, type_str):
+    """Expressions for the strides of all coordinates of a pystencils field, read from the waLBerla field."""
     stride_names = ['xStride()', 'yStride()', 'zStride()', 'fStride()']
-    stride_names = ["%s(%s->%s)" % (type_str, param.field_name, e) for e in stride_names]
+    stride_names = ["%s(%s->%s)" % (type_str, field_name, e) for e in stride_names]
     strides = stride_names[:field.spatial_dimensions]
     if field.index_dimensions > 0:
         additional_strides = [1]
@@ -70,7 +69,25 @@ def get_field_stride(param):
         assert len(additional_strides) == field.index_dimensions
         f_stride_name = stride_names[-1]
         strides.extend(["%s(%d * %s)" % (type_str, e, f_stride_name) for e in reversed(additional_strides)])
-    return strides[param.symbol.coordinate]
+    return strides
+
+
+def get_field_stride(param):
+    type_str = get_base_type(param.symbol.dtype).base_name
+    return get_field_strides(param.fields[0], param.field_name, type_str)[param.symbol.coordinate]
+
+
+def generate_layout_checks(field):
+    """Runtime checks for strides the kernel was specialized to, e.g. by choosing a layout in `generate_sweep`.
+
+    The checks are emitted once per block when the fields are extracted, not at every kernel call.
+    """
+    checks = []
+    for stride, expression in zip(field.strides, get_field_strides(field, field.name, 'int64_t')):
+        if isinstance(stride, (int, sp.Integer)):
+            checks.append('WALBERLA_CHECK_EQUAL(%s, int64_t(%d), "Field \'%s\' does not have the memory layout '
+                          'the kernel was generated for");' % (expression, stride, field.name))
+    return checks
 
 
 def generate_declaration(kernel_info, target='cpu'):
@@ -132,8 +149,12 @@ def field_extraction_code(field, is_temporary, declaration_only=False,
 
 @jinja2.contextfilter
 def generate_block_data_to_field_extraction(ctx, kernel_info, parameters_to_ignore=(), parameters=None,
-                                            declarations_only=False, no_declarations=False):
-    """Generates code that extracts all required fields of a kernel from a walberla block storage."""
+                                            declarations_only=False, no_declarations=False, layout_checks=True):
+    """Generates code that extracts all required fields of a kernel from a walberla block storage.
+
+    Unless `layout_checks` is False, the extracted fields are checked to have the strides the kernel was
+    specialized to, see `generate_layout_checks`.
+    """
     if parameters is not None:
         assert parameters_to_ignore == ()
         field_parameters = []
@@ -156,6 +177,10 @@ def generate_block_data_to_field_extraction(ctx, kernel_info, parameters_to_igno
     }
     result = "\n".join(field_extraction_code(field=field, is_temporary=False, **args) for field in normal_fields) + "\n"
     result += "\n".join(field_extraction_code(field=field, is_temporary=True, **args) for field in temporary_fields)
+    if layout_checks and not declarations_only:
+        checks = [c for field in sorted(normal_fields, key=lambda f: f.name) for c in generate_layout_checks(field)]
+        if checks:
+            result += "\n" + "\n".join(checks)
     return result
 
 
@@ -226,7 +251,8 @@ def generate_call(ctx, kernel_info, ghost_layers_to_include=0, cell_interval=Non
 
         if param.is_field_pointer:
             field = param.fields[0]
-            if field.field_type == FieldType.BUFFER:
+            # custom fields are plain pointers provided by the calling code, e.g. pack buffers with a field layout
+            if field.field_type in (FieldType.BUFFER, FieldType.CUSTOM):
                 kernel_call_lines.append("%s %s = %s;" % (param.symbol.dtype, param.symbol.name, param.field_name))
             else:
                 coordinates = get_start_coordinates(field)
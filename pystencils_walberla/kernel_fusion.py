@@ -0,0 +1,144 @@
+"""
+Fusion of several sweeps that are executed one after another on the same block.
+
+Consecutive stages are fused per cell into one kernel, if no stage reads a value with a neighbor offset, that an
+other stage of the same group writes. Values written by an earlier stage are then passed on to later stages as
+symbols instead of being loaded from memory again.
+
+Stages that depend on neighbor values of earlier stages can not be fused per cell. They are executed with overlapped
+tile temporal blocking instead: the block is cut into tiles and all stage groups are run tile by tile, such that the
+intermediate data of one tile stays in cache. Each group is executed on its tile extended by the overlap that the
+later groups need, i.e. values close to tile borders are computed redundantly by neighboring tiles. At block borders
+the overlap extends into the ghost layers, so fields read by the first group need as many ghost layers as the
+overlap plus the stencil radius, see `required_ghost_layers`.
+"""
+from collections import defaultdict
+
+import sympy as sp
+
+from pystencils import Assignment, AssignmentCollection, Field
+
+__all__ = ['fuse_stages', 'check_temporal_blocking', 'overlap_widths', 'required_ghost_layers']
+
+
+def as_assignment_collection(assignments):
+    if isinstance(assignments, AssignmentCollection):
+        return assignments
+    return AssignmentCollection(list(assignments))
+
+
+def written_fields(ac):
+    return {a.lhs.field for a in ac.main_assignments if isinstance(a.lhs, Field.Access)}
+
+
+def read_accesses(ac):
+    reads = set()
+    for a in ac.all_assignments:
+        reads.update(a.rhs.atoms(Field.Access))
+    return reads
+
+
+def is_center_access(field_access):
+    return all(o == 0 for o in field_access.offsets)
+
+
+def can_fuse_per_cell(first, second):
+    """Fusing per cell is valid, if values written by one stage are only read at the same cell by the other stage."""
+    first_written, second_written = written_fields(first), written_fields(second)
+    return all(is_center_access(fa) for fa in read_accesses(second) if fa.field in first_written) and \
+        all(is_center_access(fa) for fa in read_accesses(first) if fa.field in second_written)
+
+
+def fuse_per_cell(first, second):
+    """Merges two assignment collections into one, passing values written by `first` to `second` as symbols."""
+    used_names = {s.name for ac in (first, second) for a in ac.all_assignments for s in a.atoms(sp.Symbol)}
+    symbol_names = (s.name for s in first.subexpression_symbol_generator if s.name not in used_names)
+
+    first_names = {s.name for a in first.all_assignments for s in a.atoms(sp.Symbol)}
+    renamed = {a.lhs: sp.Symbol(next(symbol_names)) for a in second.subexpressions if a.lhs.name in first_names}
+
+    written_values = {}
+    subexpressions = list(first.subexpressions)
+    for a in first.main_assignments:
+        value = sp.Symbol(next(symbol_names))
+        subexpressions.append(Assignment(value, a.rhs))
+        written_values[a.lhs] = value
+
+    substitutions = dict(renamed)
+    substitutions.update(written_values)
+    second_subexpressions = [Assignment(renamed.get(a.lhs, a.lhs), a.rhs.subs(substitutions))
+                             for a in second.subexpressions]
+    second_main_assignments = [Assignment(a.lhs, a.rhs.subs(substitutions)) for a in second.main_assignments]
+
+    overwritten = {a.lhs for a in second_main_assignments}
+    main_assignments = [Assignment(a.lhs, written_values[a.lhs]) for a in first.main_assignments
+                        if a.lhs not in overwritten]
+    return first.copy(main_assignments + second_main_assignments, subexpressions + second_subexpressions)
+
+
+def fuse_stages(stages):
+    """Groups a sequence of stages, fusing consecutive stages per cell where this is valid.
+
+    Args:
+        stages: sequence of assignment collections or assignment lists, in the order they are executed
+
+    Returns:
+        list of assignment collections, one per group of stages
+    """
+    groups = []
+    for stage in stages:
+        stage = as_assignment_collection(stage)
+        if groups and can_fuse_per_cell(groups[-1], stage):
+            groups[-1] = fuse_per_cell(groups[-1], stage)
+        else:
+            groups.append(stage)
+    return groups
+
+
+def check_temporal_blocking(groups):
+    """Raises a ValueError if redundant computation on overlapping tiles would change the result.
+
+    This is the case if a field is written by more than one group, or if a group writes a field that is read by the
+    same group (in place update) or by an earlier group.
+    """
+    writers = defaultdict(list)
+    for i, group in enumerate(groups):
+        for field in written_fields(group):
+            writers[field.name].append(i)
+
+    for name, group_indices in writers.items():
+        if len(group_indices) > 1:
+            raise ValueError("Stages can not be fused with temporal blocking: field '{}' is written by stage groups {}"
+                             .format(name, group_indices))
+    for i, group in enumerate(groups):
+        for field in {fa.field for fa in read_accesses(group)}:
+            if writers.get(field.name, [-1])[0] >= i:
+                raise ValueError("Stages can not be fused with temporal blocking: field '{}' is read by stage group "
+                                 "{} and written by stage group {}".format(field.name, i, writers[field.name][0]))
+
+
+def overlap_widths(groups):
+    """Number of cells each group has to be computed beyond the tile, such that all later groups can read it."""
+    written = set()
+    radii = []
+    for group in groups:
+        offsets = [abs(int(o)) for fa in read_accesses(group) if fa.field in written for o in fa.offsets]
+        radii.append(max(offsets, default=0))
+        written.update(written_fields(group))
+    return [sum(radii[i + 1:]) for i in range(len(groups))]
+
+
+def required_ghost_layers(groups):
+    """Number of ghost layers each field needs, if the groups are run on tiles extended by their `overlap_widths`.
+
+    Returns:
+        dict mapping field names to the number of ghost layers
+    """
+    required = defaultdict(int)
+    for group, overlap in zip(groups, overlap_widths(groups)):
+        for fa in read_accesses(group):
+            radius = max((abs(int(o)) for o in fa.offsets), default=0)
+            required[fa.field.name] = max(required[fa.field.name], overlap + radius)
+        for field in written_fields(group):
+            required[field.name] = max(required[field.name], overlap)
+    return dict(required)
@@ -0,0 +1,160 @@
+"""
+Symbolic pre-optimization of assignment collections before kernel creation.
+
+The stages operate on a pystencils :class:`AssignmentCollection` and aim to reduce the per-cell arithmetic:
+
+    - 'constant_folding': evaluates subterms that contain no symbols at all, e.g. sqrt(2)/3. Terms with kernel
+                          parameters can not be evaluated at generation time, whether or not the parameters are
+                          `varying_parameters` of the sweep - they are moved out of the loop nest by 'hoisting'.
+    - 'cse': common subexpression elimination
+    - 'divisions': introduces subexpressions for reciprocals of non-constant denominators, such that repeated
+                   divisions become multiplications
+    - 'hoisting': moves subterms that only depend on kernel parameters (not on field values) into separate
+                  subexpressions, which pystencils then places in front of the loop nest
+"""
+import re
+from collections import OrderedDict
+
+import sympy as sp
+
+from pystencils import Assignment, AssignmentCollection, Field
+from pystencils.astnodes import LoopOverCoordinate
+from pystencils.simp import add_subexpressions_for_divisions, sympy_cse
+from pystencils.simp.simplifications import sort_assignments_topologically
+from pystencils.sympyextensions import count_operations
+
+__all__ = ['STAGES', 'optimize_assignments', 'count_operations_per_cell', 'format_operation_count_report']
+
+REPORTED_OPERATIONS = ('adds', 'muls', 'divs', 'sqrts')
+
+
+def fold_constants(ac):
+    """Numerically evaluates all non-trivial subterms that do not contain any symbols."""
+    def fold(expr):
+        if expr.is_Atom or isinstance(expr, (Field.Access, sp.Rel)):
+            return expr
+        if not expr.free_symbols and expr.is_number:
+            return expr.evalf()
+        return expr.func(*[fold(a) for a in expr.args])
+
+    def fold_assignment(a):
+        return Assignment(a.lhs, fold(a.rhs)) if isinstance(a, Assignment) else a
+
+    return ac.copy([fold_assignment(a) for a in ac.main_assignments],
+                   [fold_assignment(a) for a in ac.subexpressions])
+
+
+LOOP_COUNTER_NAME = re.compile(LoopOverCoordinate.LOOP_COUNTER_NAME_PREFIX + r"_\d+")
+
+
+def is_loop_counter(symbol):
+    """Loop counters, e.g. the cell coordinates `ps.x_`, are free symbols, but change from cell to cell."""
+    return LOOP_COUNTER_NAME.fullmatch(symbol.name) is not None
+
+
+def loop_invariant_symbols(ac):
+    """Returns all symbols of the collection, whose value does not change from cell to cell.
+
+    These are the kernel parameters and all subexpressions that are computed from parameters only.
+    """
+    defined = {a.lhs for a in ac.all_assignments if isinstance(a, Assignment)}
+    invariant = {s for s in ac.free_symbols if not isinstance(s, Field.Access) and not is_loop_counter(s)} - defined
+    for a in ac.subexpressions:
+        if isinstance(a, Assignment) and is_loop_invariant(a.rhs, invariant):
+            invariant.add(a.lhs)
+    return invariant
+
+
+def is_loop_invariant(expr, invariant_symbols):
+    return not expr.atoms(Field.Access) and expr.free_symbols <= invariant_symbols
+
+
+def hoist_loop_invariants(ac):
+    """Replaces maximal loop-invariant subterms by new subexpressions."""
+    invariant = loop_invariant_symbols(ac)
+    symbol_names = unused_symbol_names(ac)
+    hoisted = OrderedDict()
+
+    def new_symbol(term):
+        if term not in hoisted:
+            hoisted[term] = sp.Symbol(next(symbol_names))
+        return hoisted[term]
+
+    def is_hoistable(term):
+        return not term.is_Atom and bool(term.free_symbols) and is_loop_invariant(term, invariant)
+
+    def hoist(term):
+        if term.is_Atom or isinstance(term, Field.Access):
+            return term
+        if is_hoistable(term):
+            return new_symbol(term)
+        if term.func in (sp.Add, sp.Mul):
+            invariant_args = [a for a in term.args if is_loop_invariant(a, invariant)]
+            other_args = [hoist(a) for a in term.args if a not in invariant_args]
+            if other_args and is_hoistable(term.func(*invariant_args)):
+                invariant_args = [new_symbol(term.func(*invariant_args))]
+            return term.func(*(invariant_args + other_args))
+        return term.func(*[hoist(a) for a in term.args])
+
+    def hoist_assignment(a):
+        if not isinstance(a, Assignment) or a.lhs in invariant:
+            return a
+        return Assignment(a.lhs, hoist(a.rhs))
+
+    main_assignments = [hoist_assignment(a) for a in ac.main_assignments]
+    subexpressions = [hoist_assignment(a) for a in ac.subexpressions]
+    subexpressions = [Assignment(s, t) for t, s in hoisted.items()] + subexpressions
+    return ac.copy(main_assignments, sort_assignments_topologically(subexpressions))
+
+
+def unused_symbol_names(ac):
+    used_names = {s.name for a in ac.all_assignments for s in a.atoms(sp.Symbol)}
+    return (s.name for s in ac.subexpression_symbol_generator if s.name not in used_names)
+
+
+STAGES = OrderedDict([
+    ('constant_folding', fold_constants),
+    ('cse', sympy_cse),
+    ('divisions', add_subexpressions_for_divisions),
+    ('hoisting', hoist_loop_invariants),
+])
+
+
+def count_operations_per_cell(ac):
+    """Counts operations of all assignments that have to be evaluated for every cell."""
+    invariant = loop_invariant_symbols(ac)
+    per_cell = [a for a in ac.all_assignments if isinstance(a, Assignment) and a.lhs not in invariant]
+    return count_operations(per_cell, only_type=None)
+
+
+def optimize_assignments(assignments, stages=tuple(STAGES.keys())):
+    """Runs the given symbolic optimization stages in order.
+
+    Args:
+        assignments: sequence of assignments or assignment collection
+        stages: sequence of stage names, see `STAGES`
+
+    Returns:
+        tuple of optimized assignment collection and a list of (stage name, operation count) pairs, starting with
+        the operation count of the input
+    """
+    if not isinstance(assignments, AssignmentCollection):
+        assignments = AssignmentCollection(list(assignments))
+    unknown_stages = set(stages) - set(STAGES.keys())
+    if unknown_stages:
+        raise ValueError("Unknown symbolic optimization stages {}. Available are {}".format(
+            sorted(unknown_stages), list(STAGES.keys())))
+
+    report = [('input', count_operations_per_cell(assignments))]
+    for stage in stages:
+        assignments = STAGES[stage](assignments)
+        report.append((stage, count_operations_per_cell(assignments)))
+    return assignments, report
+
+
+def format_operation_count_report(report, title=""):
+    lines = [title] if title else []
+    lines.append("    {:<20}".format("stage") + "".join("{:>8}".format(op) for op in REPORTED_OPERATIONS))
+    for stage, counts in report:
+        lines.append("    {:<20}".format(stage) + "".join("{:>8}".format(counts[op]) for op in REPORTED_OPERATIONS))
+    return "\n".join(lines)
@@ -0,0 +1,153 @@
+//======================================================================================================================
+//
+//  This file is part of waLBerla. waLBerla is free software: you can
+//  redistribute it and/or modify it under the terms of the GNU General Public
+//  License as published by the Free Software Foundation, either version 3 of
+//  the License, or (at your option) any later version.
+//
+//  waLBerla is distributed in the hope that it will be useful, but WITHOUT
+//  ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+//  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+//  for more details.
+//
+//  You should have received a copy of the GNU General Public License along
+//  with waLBerla (see COPYING.txt). If not, see <http://www.gnu.org/licenses/>.
+//
+//! \\file {{class_name}}.h
+//! \\author pystencils
+//======================================================================================================================
+
+#pragma once
+#include "core/DataTypes.h"
+#include "core/Set.h"
+#include "core/debug/CheckFunctions.h"
+#include "core/selectable/IsSetSelected.h"
+#include "core/uid/SUID.h"
+#include "blockforest/BlockForest.h"
+#include "blockforest/PhantomBlockForest.h"
+#include "blockforest/loadbalancing/PODPhantomData.h"
+#include "domain_decomposition/IBlock.h"
+
+{% for sweep in sweeps %}
+#include "{{sweep}}.h"
+{% endfor %}
+
+#include <array>
+#include <vector>
+
+namespace walberla {
+namespace {{namespace}} {
+
+
+/// Sums the cost estimates of the sweeps of one time step to a block weight.
+///
+/// A sweep only contributes on blocks it runs on: blocks on which its field is not allocated cost nothing, and
+/// like for the sweeps of a time loop, required and incompatible selectors of the block state can be set per sweep
+/// with setSelectors().
+///
+/// Use operator()( IBlock * ) directly, or register an instance as phantom block data assignment function:
+///     blockforest.setRefreshPhantomBlockDataAssignmentFunction( weights );
+/// together with blockforest::PODPhantomWeight< double > as phantom data type of the load balancer.
+class {{class_name}}
+{
+public:
+    using PhantomBlockWeight = blockforest::PODPhantomWeight< double >;
+
+    static const uint_t numberOfSweeps = {{sweeps|length}};
+
+    {{class_name}}( {% for sweep in sweeps %}const shared_ptr< {{sweep}} > & sweep{{loop.index0}}, {% endfor %}double flopWeight = 1.0, double byteWeight = 1.0 )
+        : {% for sweep in sweeps %}sweep{{loop.index0}}_( sweep{{loop.index0}} ), {% endfor %}flopWeight_( flopWeight ), byteWeight_( byteWeight )
+    {
+        requiredSelectors_.fill( Set< SUID >::emptySet() );
+        incompatibleSelectors_.fill( Set< SUID >::emptySet() );
+    }
+
+    /// Restricts the sweep with the given index (in the order of the constructor) to blocks whose state contains all
+    /// required and none of the incompatible selectors
+    void setSelectors( uint_t sweep, const Set< SUID > & requiredSelectors,
+                       const Set< SUID > & incompatibleSelectors = Set< SUID >::emptySet() )
+    {
+        WALBERLA_CHECK_LESS( sweep, uint_t( numberOfSweeps ) );
+        requiredSelectors_[sweep] = requiredSelectors;
+        incompatibleSelectors_[sweep] = incompatibleSelectors;
+    }
+
+    double operator()( IBlock * block ) const
+    {
+        double weight = 0.0;
+        for( uint_t i = 0; i < numberOfSweeps; ++i )
+            weight += cost( i, block );
+        return weight;
+    }
+
+    void operator()( std::vector< std::pair< const PhantomBlock *, walberla::any > > & blockData,
+                     const PhantomBlockForest & phantomForest ) const
+    {
+        auto & forest = const_cast< BlockForest & >( phantomForest.getBlockForest() );
+
+        // blocks that are split or merged do not exist yet - since all blocks of a structured block forest
+        // have the same number of cells, each sweep selected by their state contributes its average cost on the
+        // existing blocks it runs on
+        std::array< double, numberOfSweeps > averageCost;
+        std::array< uint_t, numberOfSweeps > numberOfBlocks;
+        averageCost.fill( 0.0 );
+        numberOfBlocks.fill( uint_t( 0 ) );
+        for( auto & block : forest )
+            for( uint_t i = 0; i < numberOfSweeps; ++i )
+            {
+                const double c = cost( i, &block );
+                if( c > 0.0 )
+                {
+                    averageCost[i] += c;
+                    ++numberOfBlocks[i];
+                }
+            }
+
+        for( auto & it : blockData )
+        {
+            const PhantomBlock * phantom = it.first;
+            IBlock * block = forest.getBlock( phantom->getId() );
+            double weight = 0.0;
+            if( block != nullptr )
+                weight = (*this)( block );
+            else
+                for( uint_t i = 0; i < numberOfSweeps; ++i )
+                    if( numberOfBlocks[i] > 0 && isSelected( i, phantom->getState() ) )
+                        weight += averageCost[i] / double( numberOfBlocks[i] );
+            it.second = PhantomBlockWeight( weight );
+        }
+    }
+
+private:
+    bool isSelected( uint_t sweep, const Set< SUID > & state ) const
+    {
+        return selectable::isSetSelected( state, requiredSelectors_[sweep], incompatibleSelectors_[sweep] );
+    }
+
+    double cost( uint_t sweep, IBlock * block ) const
+    {
+        if( !isSelected( sweep, block->getState() ) )
+            return 0.0;
+        switch( sweep )
+        {
+            {%- for sweep in sweeps %}
+            case {{loop.index0}}:
+                return sweep{{loop.index0}}_->cost( block, flopWeight_, byteWeight_ );
+            {%- endfor %}
+            default:
+                return 0.0;
+        }
+    }
+
+    {% for sweep in sweeps %}
+    shared_ptr< {{sweep}} > sweep{{loop.index0}}_;
+    {% endfor %}
+    double flopWeight_;
+    double byteWeight_;
+    std::array< Set< SUID >, numberOfSweeps > requiredSelectors_;
+    std::array< Set< SUID >, numberOfSweeps > incompatibleSelectors_;
+};
+
+
+} // namespace {{namespace}}
+} // namespace walberla
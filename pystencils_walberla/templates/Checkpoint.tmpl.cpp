@@ -0,0 +1,220 @@
+#include "core/Abort.h"
+#include "core/DataTypes.h"
+#include "core/debug/CheckFunctions.h"
+#include "core/mpi/MPIManager.h"
+#include "{{class_name}}.h"
+
+#include <algorithm>
+#include <cstdint>
+#include <fstream>
+
+{% for header in headers %}
+#include {{header}}
+{% endfor %}
+
+#if ( defined WALBERLA_CXX_COMPILER_IS_GNU ) || ( defined WALBERLA_CXX_COMPILER_IS_CLANG )
+#   pragma GCC diagnostic push
+#   pragma GCC diagnostic ignored "-Wconversion"
+#endif
+
+namespace walberla {
+namespace {{namespace}} {
+
+
+{{pack_kernel|generate_definition(target)}}
+
+{{unpack_kernel|generate_definition(target)}}
+
+{% if compression %}
+
+namespace internal_{{class_name|lower}}_compression {
+
+// regroups the bytes of all values by their significance, such that e.g. the exponent bytes are contiguous
+static void shuffle( const unsigned char * in, unsigned char * out, uint_t numberOfValues )
+{
+    for( uint_t i = 0; i < numberOfValues; ++i )
+        for( uint_t b = 0; b < sizeof( {{dtype}} ); ++b )
+            out[ b * numberOfValues + i ] = in[ i * sizeof( {{dtype}} ) + b ];
+}
+
+static void unshuffle( const unsigned char * in, unsigned char * out, uint_t numberOfValues )
+{
+    for( uint_t i = 0; i < numberOfValues; ++i )
+        for( uint_t b = 0; b < sizeof( {{dtype}} ); ++b )
+            out[ i * sizeof( {{dtype}} ) + b ] = in[ b * numberOfValues + i ];
+}
+
+// PackBits: control byte c < 128 is followed by c + 1 literal bytes, c > 128 by one byte repeated 257 - c times
+static void encode( const unsigned char * in, uint_t size, std::vector< unsigned char > & out )
+{
+    uint_t i = 0;
+    while( i < size )
+    {
+        uint_t run = 1;
+        while( i + run < size && run < 128 && in[ i + run ] == in[i] )
+            ++run;
+        if( run > 1 )
+        {
+            out.push_back( static_cast< unsigned char >( 257 - run ) );
+            out.push_back( in[i] );
+            i += run;
+            continue;
+        }
+        const uint_t start = i;
+        while( i < size && i - start < 128 && !( i + 1 < size && in[i] == in[ i + 1 ] ) )
+            ++i;
+        out.push_back( static_cast< unsigned char >( i - start - 1 ) );
+        out.insert( out.end(), in + start, in + i );
+    }
+}
+
+static void decode( const unsigned char * in, uint_t size, unsigned char * out, uint_t outSize )
+{
+    uint_t i = 0;
+    uint_t o = 0;
+    while( i < size )
+    {
+        const uint_t control = in[ i++ ];
+        if( control < 128 )
+        {
+            const uint_t length = control + 1;
+            if( i + length > size || o + length > outSize )
+                WALBERLA_ABORT( "Corrupt checkpoint data: literal run exceeds the buffer" );
+            std::copy( in + i, in + i + length, out + o );
+            i += length;
+            o += length;
+        }
+        else if( control > 128 )
+        {
+            const uint_t length = 257 - control;
+            if( i >= size || o + length > outSize )
+                WALBERLA_ABORT( "Corrupt checkpoint data: repeated run exceeds the buffer" );
+            std::fill( out + o, out + o + length, in[ i++ ] );
+            o += length;
+        }
+    }
+    if( o != outSize )
+        WALBERLA_ABORT( "Corrupt checkpoint data: " << o << " bytes decoded, " << outSize << " expected" );
+}
+
+} // namespace internal_{{class_name|lower}}_compression
+{% endif %}
+
+
+void {{class_name}}::pack( IBlock * block, unsigned char * byte_buffer ) const
+{
+    {{dtype}} * buffer = reinterpret_cast<{{dtype}}*>(byte_buffer);
+
+    {{pack_kernel|generate_block_data_to_field_extraction(parameters_to_ignore=['buffer'])|indent(4)}}
+    {{pack_kernel|generate_call|indent(4)}}
+}
+
+
+void {{class_name}}::unpack( IBlock * block, unsigned char * byte_buffer ) const
+{
+    {{dtype}} * buffer = reinterpret_cast<{{dtype}}*>(byte_buffer);
+
+    {{unpack_kernel|generate_block_data_to_field_extraction(parameters_to_ignore=['buffer'])|indent(4)}}
+    {{unpack_kernel|generate_call|indent(4)}}
+}
+
+
+uint_t {{class_name}}::size( IBlock * block ) const
+{
+    {{pack_kernel|generate_block_data_to_field_extraction(parameters=[field_name], layout_checks=False)|indent(4)}}
+    return {{field_name}}->xSize() * {{field_name}}->ySize() * {{field_name}}->zSize() * uint_t( {{elements_per_cell}} ) * sizeof( {{dtype}} );
+}
+
+
+void {{class_name}}::serialize( IBlock * block, std::vector< unsigned char > & buffer ) const
+{
+    const uint_t dataSize = size( block );
+    {% if compression %}
+    using namespace internal_{{class_name|lower}}_compression;
+    std::vector< unsigned char > packed( dataSize );
+    std::vector< unsigned char > shuffled( dataSize );
+    pack( block, packed.data() );
+    shuffle( packed.data(), shuffled.data(), dataSize / sizeof( {{dtype}} ) );
+    buffer.clear();
+    encode( shuffled.data(), dataSize, buffer );
+    {% else %}
+    buffer.resize( dataSize );
+    pack( block, buffer.data() );
+    {% endif %}
+}
+
+
+void {{class_name}}::deserialize( IBlock * block, const std::vector< unsigned char > & buffer ) const
+{
+    const uint_t dataSize = size( block );
+    {% if compression %}
+    using namespace internal_{{class_name|lower}}_compression;
+    std::vector< unsigned char > shuffled( dataSize );
+    std::vector< unsigned char > packed( dataSize );
+    decode( buffer.data(), buffer.size(), shuffled.data(), dataSize );
+    unshuffle( shuffled.data(), packed.data(), dataSize / sizeof( {{dtype}} ) );
+    unpack( block, packed.data() );
+    {% else %}
+    WALBERLA_CHECK_EQUAL( buffer.size(), dataSize, "Checkpoint data does not match the block size" );
+    unpack( block, const_cast< unsigned char * >( buffer.data() ) );
+    {% endif %}
+}
+
+
+void {{class_name}}::save( const shared_ptr< StructuredBlockForest > & blocks, const std::string & fileName ) const
+{
+    const std::string processFileName = fileName + "." + std::to_string( mpi::MPIManager::instance()->rank() );
+    std::ofstream file( processFileName, std::ios::binary );
+    WALBERLA_CHECK( file.good(), "Could not open checkpoint file " << processFileName );
+
+    const uint64_t numberOfBlocks = uint64_t( blocks->size() );
+    file.write( reinterpret_cast< const char * >( &numberOfBlocks ), sizeof( numberOfBlocks ) );
+
+    std::vector< unsigned char > buffer;
+    for( auto & block : *blocks )
+    {
+        serialize( &block, buffer );
+        const uint64_t bufferSize = uint64_t( buffer.size() );
+        file.write( reinterpret_cast< const char * >( &bufferSize ), sizeof( bufferSize ) );
+        file.write( reinterpret_cast< const char * >( buffer.data() ), std::streamsize( buffer.size() ) );
+    }
+    WALBERLA_CHECK( file.good(), "Could not write checkpoint file " << processFileName );
+}
+
+
+void {{class_name}}::load( const shared_ptr< StructuredBlockForest > & blocks, const std::string & fileName ) const
+{
+    const std::string processFileName = fileName + "." + std::to_string( mpi::MPIManager::instance()->rank() );
+    std::ifstream file( processFileName, std::ios::binary );
+    WALBERLA_CHECK( file.good(), "Could not open checkpoint file " << processFileName );
+
+    uint64_t numberOfBlocks = 0;
+    file.read( reinterpret_cast< char * >( &numberOfBlocks ), sizeof( numberOfBlocks ) );
+    WALBERLA_CHECK( file.good(), "Could not read checkpoint file " << processFileName );
+    WALBERLA_CHECK_EQUAL( numberOfBlocks, uint64_t( blocks->size() ),
+                          "Checkpoint " << processFileName << " was written with a different domain decomposition" );
+
+    std::vector< unsigned char > buffer;
+    for( auto & block : *blocks )
+    {
+        uint64_t bufferSize = 0;
+        file.read( reinterpret_cast< char * >( &bufferSize ), sizeof( bufferSize ) );
+        // each literal run adds one control byte and is followed by a repeated run of at least two bytes
+        const uint_t maxBufferSize = size( &block ) + size( &block ) / uint_t( 2 ) + uint_t( 1 );
+        if( !file.good() || bufferSize > uint64_c( maxBufferSize ) )
+            WALBERLA_ABORT( "Corrupt checkpoint file " << processFileName );
+        buffer.resize( uint_c( bufferSize ) );
+        file.read( reinterpret_cast< char * >( buffer.data() ), std::streamsize( bufferSize ) );
+        WALBERLA_CHECK( file.good(), "Could not read checkpoint file " << processFileName );
+        deserialize( &block, buffer );
+    }
+}
+
+
+} // namespace {{namespace}}
+} // namespace walberla
+
+
+#if ( defined WALBERLA_CXX_COMPILER_IS_GNU ) || ( defined WALBERLA_CXX_COMPILER_IS_CLANG )
+#   pragma GCC diagnostic pop
+#endif
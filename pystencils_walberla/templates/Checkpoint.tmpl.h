@@ -0,0 +1,55 @@
+#pragma once
+#include "core/DataTypes.h"
+#include "blockforest/StructuredBlockForest.h"
+#include "field/GhostLayerField.h"
+#include "domain_decomposition/IBlock.h"
+
+#include <string>
+#include <vector>
+
+#define FUNC_PREFIX
+
+#ifdef __GNUC__
+#define RESTRICT __restrict__
+#elif _MSC_VER
+#define RESTRICT __restrict
+#else
+#define RESTRICT
+#endif
+
+namespace walberla {
+namespace {{namespace}} {
+
+
+/// Checkpoint/restart of the inner region of all fields, {{elements_per_cell}} value(s) of type {{dtype}} per cell.
+{% if compression %}
+/// Buffers are compressed with a byte shuffle followed by run-length encoding.
+{% endif %}
+class {{class_name}}
+{
+public:
+    {{class_name}}( {{pack_kernel|generate_constructor_parameters(parameters_to_ignore=['buffer'])}} )
+        : {{ pack_kernel|generate_constructor_initializer_list(parameters_to_ignore=['buffer']) }}
+    {};
+
+    /// Number of bytes of the uncompressed checkpoint data of the given block
+    uint_t size( IBlock * block ) const;
+
+    void serialize( IBlock * block, std::vector< unsigned char > & buffer ) const;
+    void deserialize( IBlock * block, const std::vector< unsigned char > & buffer ) const;
+
+    /// Writes all blocks of this process to the file "<fileName>.<rank>"
+    void save( const shared_ptr< StructuredBlockForest > & blocks, const std::string & fileName ) const;
+    /// Restores all blocks of this process, the domain decomposition has to be the same as when saving
+    void load( const shared_ptr< StructuredBlockForest > & blocks, const std::string & fileName ) const;
+
+private:
+    void pack  ( IBlock * block, unsigned char * buffer ) const;
+    void unpack( IBlock * block, unsigned char * buffer ) const;
+
+    {{pack_kernel|generate_members(parameters_to_ignore=['buffer'])|indent(4)}}
+};
+
+
+} // namespace {{namespace}}
+} // namespace walberla
@@ -0,0 +1,161 @@
+//======================================================================================================================
+//
+//  This file is part of waLBerla. waLBerla is free software: you can
+//  redistribute it and/or modify it under the terms of the GNU General Public
+//  License as published by the Free Software Foundation, either version 3 of
+//  the License, or (at your option) any later version.
+//
+//  waLBerla is distributed in the hope that it will be useful, but WITHOUT
+//  ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+//  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+//  for more details.
+//
+//  You should have received a copy of the GNU General Public License along
+//  with waLBerla (see COPYING.txt). If not, see <http://www.gnu.org/licenses/>.
+//
+//! \\file {{class_name}}.h
+//! \\author pystencils
+//======================================================================================================================
+
+#pragma once
+#include "core/DataTypes.h"
+#include "blockforest/StructuredBlockForest.h"
+{% if log_hidden_time %}
+#include <algorithm>
+
+#include "core/logging/Logging.h"
+#include "core/timing/TimingPool.h"
+{% endif %}
+{% if target is equalto 'gpu' -%}
+#include "cuda/CudaRAII.h"
+#include "cuda/ErrorChecking.h"
+#include "cuda/communication/UniformGPUScheme.h"
+{%- else -%}
+#include "blockforest/communication/UniformBufferedScheme.h"
+{%- endif %}
+#include "stencil/{{stencil}}.h"
+
+#include "{{sweep}}.h"
+#include "{{pack_info}}.h"
+
+namespace walberla {
+namespace {{namespace}} {
+
+
+/// One time step of {{sweep}} with communication hiding:
+/// the ghost layer exchange with {{pack_info}} is started, the inner part of all blocks is updated while the
+/// messages are in flight, then the communication is finished and the outer part is updated including field swaps.
+class {{class_name}}
+{
+public:
+    {% if target is equalto 'gpu' -%}
+    using CommunicationScheme = cuda::communication::UniformGPUScheme< stencil::{{stencil}} >;
+    {%- else -%}
+    using CommunicationScheme = blockforest::communication::UniformBufferedScheme< stencil::{{stencil}} >;
+    {%- endif %}
+
+    {{class_name}}( const shared_ptr< StructuredBlockForest > & blocks,
+                    const shared_ptr< {{sweep}} > & sweep,
+                    const shared_ptr< {{pack_info}} > & packInfo )
+        : blocks_( blocks ), sweep_( sweep ), communication_( blocks )
+          {%- if target is equalto 'gpu' %},
+          innerStream_( cuda::StreamRAII::newPriorityStream( 0 ) ),
+          outerStream_( cuda::StreamRAII::newPriorityStream( -1 ) )
+          {%- endif %}
+    {
+        communication_.addPackInfo( packInfo );
+        sweep_->setOuterSlabsConcurrent( {{ 'true' if concurrent_outer_slabs else 'false' }} );
+    }
+
+    void operator()()
+    {
+        {% if log_hidden_time -%}
+        timing_["communication start"].start();
+        {% endif -%}
+        communication_.startCommunication({% if target is equalto 'gpu' %} innerStream_ {% endif %});
+        {% if log_hidden_time -%}
+        timing_["communication start"].end();
+        timing_["inner"].start();
+        {% endif -%}
+        for( auto & block : *blocks_ )
+            sweep_->inner( &block{% if target is equalto 'gpu' %}, innerStream_{% endif %} );
+        {% if log_hidden_time -%}
+        {% if target is equalto 'gpu' -%}
+        WALBERLA_CUDA_CHECK( cudaStreamSynchronize( innerStream_ ) );
+        {% endif -%}
+        timing_["inner"].end();
+        timing_["communication wait"].start();
+        {% endif -%}
+        communication_.wait({% if target is equalto 'gpu' %} outerStream_ {% endif %});
+        {% if log_hidden_time -%}
+        timing_["communication wait"].end();
+        timing_["outer"].start();
+        {% endif -%}
+        for( auto & block : *blocks_ )
+            sweep_->outer( &block{% if target is equalto 'gpu' %}, outerStream_{% endif %} );
+        {% if target is equalto 'gpu' -%}
+        WALBERLA_CUDA_CHECK( cudaStreamSynchronize( outerStream_ ) );
+        WALBERLA_CUDA_CHECK( cudaStreamSynchronize( innerStream_ ) );
+        {% endif -%}
+        {% if log_hidden_time -%}
+        timing_["outer"].end();
+        {% endif %}
+    }
+
+    static std::function< void() > getTimestep( const shared_ptr< {{class_name}} > & timestep ) {
+        return [timestep]() { (*timestep)(); };
+    }
+    {% if log_hidden_time %}
+
+    WcTimingPool & timing() { return timing_; }
+
+    /// Runs the given number of blocking ghost layer exchanges (without any sweep) and returns their average time.
+    /// The exchanges only refresh the ghost layers with the current values, the simulation state is not changed.
+    double measureCommunicationTime( uint_t exchanges = 10 )
+    {
+        for( uint_t i = 0; i < exchanges; ++i )
+        {
+            timing_["communication (blocking)"].start();
+            communication_.startCommunication({% if target is equalto 'gpu' %} innerStream_ {% endif %});
+            communication_.wait({% if target is equalto 'gpu' %} innerStream_ {% endif %});
+            {% if target is equalto 'gpu' -%}
+            WALBERLA_CUDA_CHECK( cudaStreamSynchronize( innerStream_ ) );
+            {% endif -%}
+            timing_["communication (blocking)"].end();
+        }
+        return timing_["communication (blocking)"].average();
+    }
+
+    /// Logs how much of the communication was hidden behind the inner update, averaged over the time steps.
+    /// The communication time is measured with `measureCommunicationTime`. Of it, the time spent in starting and
+    /// waiting for the communication is exposed, the rest is hidden - but at most the time of the inner update.
+    void logHiddenCommunicationTime( uint_t exchanges = 10 )
+    {
+        if( timing_["inner"].getCounter() == 0 )
+            return;
+        const double communication = measureCommunicationTime( exchanges );
+        const double exposed = timing_["communication start"].average() + timing_["communication wait"].average();
+        const double hidden = std::min( timing_["inner"].average(), std::max( communication - exposed, 0.0 ) );
+        const double fraction = communication > 0.0 ? hidden / communication : 0.0;
+        WALBERLA_LOG_INFO( "{{class_name}}: communication " << communication << "s per time step, hidden behind "
+                           "inner update " << hidden << "s, exposed " << exposed << "s ("
+                           << 100.0 * fraction << "% hidden)" );
+    }
+    {% endif %}
+
+private:
+    shared_ptr< StructuredBlockForest > blocks_;
+    shared_ptr< {{sweep}} > sweep_;
+    CommunicationScheme communication_;
+    {% if target is equalto 'gpu' %}
+    cuda::StreamRAII innerStream_;
+    cuda::StreamRAII outerStream_;
+    {% endif %}
+    {% if log_hidden_time %}
+    WcTimingPool timing_;
+    {% endif %}
+};
+
+
+} // namespace {{namespace}}
+} // namespace walberla
@@ -1,3 +1,7 @@
+{% if contiguous_copies -%}
+#include <cstring>
+
+{% endif -%}
 #include "stencil/Directions.h"
 #include "core/cell/CellInterval.h"
 #include "core/DataTypes.h"
@@ -7,6 +11,28 @@
 #include {{header}}
 {% endfor %}
 
+{% macro copy_rows(copy, packing) -%}
+// the slice consists of contiguous x-rows of the field
+const uint_t rowLength = uint_c( ci.xSize() ){% if copy.values_per_cell > 1 %} * uint_t( {{copy.values_per_cell}} ){% endif %};
+{%- if copy.rows|length > 1 %}
+const uint_t numCells = uint_c( ci.numCells() );
+{%- endif %}
+{{dtype}} * b = buffer;
+for( cell_idx_t z = ci.zMin(); z <= ci.zMax(); ++z )
+    for( cell_idx_t y = ci.yMin(); y <= ci.yMax(); ++y, b += rowLength )
+    {
+        {%- for field, index in copy.rows %}
+        {%- set row = "b + %d * numCells"|format(loop.index0) if loop.index0 else "b" %}
+        {%- set data = "%s->dataAt( ci.xMin(), y, z, %s )"|format(field, index) %}
+        {%- if packing %}
+        std::memcpy( {{row}}, {{data}}, rowLength * sizeof( {{dtype}} ) );
+        {%- else %}
+        std::memcpy( {{data}}, {{row}}, rowLength * sizeof( {{dtype}} ) );
+        {%- endif %}
+        {%- endfor %}
+    }
+{%- endmacro %}
+
 namespace walberla {
 namespace {{namespace}} {
 
@@ -34,13 +60,39 @@ void {{class_name}}::pack(Direction dir, unsigned char * byte_buffer, IBlock * b
     switch( dir )
     {
         {%- for direction_set, kernel in pack_kernels.items()  %}
-        {%- for dir in direction_set %}
+        {%- if direction_set in contiguous_copies %}
+        {%- set copy = contiguous_copies[direction_set] %}
+        {%- for dir in copy.directions %}
+        case stencil::{{dir}}:
+        {%- endfor %}
+        {
+            {%- if copy.condition %}
+            if( {{copy.condition}} )
+            {
+                {{copy_rows(copy, true)|indent(16)}}
+            }
+            else
+            {
+                {{kernel|generate_call(cell_interval="ci")|indent(16)}}
+            }
+            {%- else %}
+            {{copy_rows(copy, true)|indent(12)}}
+            {%- endif %}
+            break;
+        }
+        {%- set kernel_directions = copy.kernel_directions %}
+        {%- else %}
+        {%- set kernel_directions = direction_set %}
+        {%- endif %}
+        {%- if kernel_directions %}
+        {%- for dir in kernel_directions %}
         case stencil::{{dir}}:
         {%- endfor %}
         {
             {{kernel|generate_call(cell_interval="ci")|indent(12)}}
             break;
         }
+        {%- endif %}
         {% endfor %}
 
         default:
@@ -61,13 +113,39 @@ void {{class_name}}::unpack(Direction dir, unsigned char * byte_buffer, IBlock *
     switch( communciationDirection )
     {
         {%- for direction_set, kernel in unpack_kernels.items()  %}
-        {%- for dir in direction_set %}
+        {%- if direction_set in contiguous_copies %}
+        {%- set copy = contiguous_copies[direction_set] %}
+        {%- for dir in copy.directions %}
+        case stencil::{{dir}}:
+        {%- endfor %}
+        {
+            {%- if copy.condition %}
+            if( {{copy.condition}} )
+            {
+                {{copy_rows(copy, false)|indent(16)}}
+            }
+            else
+            {
+                {{kernel|generate_call(cell_interval="ci")|indent(16)}}
+            }
+            {%- else %}
+            {{copy_rows(copy, false)|indent(12)}}
+            {%- endif %}
+            break;
+        }
+        {%- set kernel_directions = copy.kernel_directions %}
+        {%- else %}
+        {%- set kernel_directions = direction_set %}
+        {%- endif %}
+        {%- if kernel_directions %}
+        {%- for dir in kernel_directions %}
         case stencil::{{dir}}:
         {%- endfor %}
         {
             {{kernel|generate_call(cell_interval="ci")|indent(12)}}
             break;
         }
+        {%- endif %}
         {% endfor %}
 
         default:
@@ -78,7 +156,7 @@ void {{class_name}}::unpack(Direction dir, unsigned char * byte_buffer, IBlock *
 
 uint_t {{class_name}}::size(stencil::Direction dir, const IBlock * block) const
 {
-    {{fused_kernel|generate_block_data_to_field_extraction(parameters_to_ignore=['buffer'])|indent(4)}}
+    {{fused_kernel|generate_block_data_to_field_extraction(parameters_to_ignore=['buffer'], layout_checks=False)|indent(4)}}
     CellInterval ci;
     {{field_name}}->getGhostRegion(dir, ci, 1, false);
 
@@ -0,0 +1,149 @@
+//======================================================================================================================
+//
+//  This file is part of waLBerla. waLBerla is free software: you can
+//  redistribute it and/or modify it under the terms of the GNU General Public
+//  License as published by the Free Software Foundation, either version 3 of
+//  the License, or (at your option) any later version.
+//
+//  waLBerla is distributed in the hope that it will be useful, but WITHOUT
+//  ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+//  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+//  for more details.
+//
+//  You should have received a copy of the GNU General Public License along
+//  with waLBerla (see COPYING.txt). If not, see <http://www.gnu.org/licenses/>.
+//
+//! \\file {{class_name}}.cpp
+//! \\ingroup lbm
+//! \\author lbmpy
+//======================================================================================================================
+
+#include <algorithm>
+#include <cmath>
+
+#include "core/DataTypes.h"
+#include "core/Macros.h"
+#include "core/cell/CellInterval.h"
+#include "{{class_name}}.h"
+{% for header in headers %}
+#include {{header}}
+{% endfor %}
+
+
+#define FUNC_PREFIX
+
+#if ( defined WALBERLA_CXX_COMPILER_IS_GNU ) || ( defined WALBERLA_CXX_COMPILER_IS_CLANG )
+#   pragma GCC diagnostic push
+#   pragma GCC diagnostic ignored "-Wfloat-equal"
+#   pragma GCC diagnostic ignored "-Wshadow"
+#   pragma GCC diagnostic ignored "-Wconversion"
+#   pragma GCC diagnostic ignored "-Wunused-variable"
+#endif
+
+#if ( defined WALBERLA_CXX_COMPILER_IS_INTEL )
+#pragma warning push
+#pragma warning( disable :  1599 )
+#endif
+
+using namespace std;
+
+namespace walberla {
+namespace {{namespace}} {
+
+
+{% for stage, overlap in stages %}
+{{stage|generate_definition(target)}}
+{% endfor %}
+
+
+void {{class_name}}::operator() ( IBlock * block )
+{
+    {{kernel|generate_block_data_to_field_extraction|indent(4)}}
+
+    {%- for name, ghost_layers in ghost_layers.items() %}
+    WALBERLA_CHECK_GREATER_EQUAL( {{name}}->nrOfGhostLayers(), uint_t( {{ghost_layers}} ), "Field '{{name}}' needs {{ghost_layers}} ghost layer(s) for the overlapped tiles" );
+    {%- endfor %}
+
+    const cell_idx_t xSize = cell_idx_c( {{field}}->xSize() );
+    const cell_idx_t ySize = cell_idx_c( {{field}}->ySize() );
+    const cell_idx_t zSize = cell_idx_c( {{field}}->zSize() );
+    {% if spatial_dimensions == 3 -%}
+    const cell_idx_t tileSizeZ_ = cell_idx_c( tileSizeZ );
+    {%- else -%}
+    const cell_idx_t tileSizeZ_ = cell_idx_t( 1 );
+    {%- endif %}
+
+    const int64_t tilesX = int64_c( ( xSize + cell_idx_c( tileSizeX ) - 1 ) / cell_idx_c( tileSizeX ) );
+    const int64_t tilesY = int64_c( ( ySize + cell_idx_c( tileSizeY ) - 1 ) / cell_idx_c( tileSizeY ) );
+    const int64_t tilesZ = int64_c( ( zSize + tileSizeZ_ - 1 ) / tileSizeZ_ );
+    {%- if openmp and stages[0][1] > 0 %}
+
+    // tiles of one color are at least one tile apart, their extended regions are disjoint if no overlap is wider
+    // than half a tile
+    WALBERLA_CHECK_GREATER_EQUAL( std::min( {% if spatial_dimensions == 3 %}{ {% endif %}cell_idx_c( tileSizeX ), cell_idx_c( tileSizeY ){% if spatial_dimensions == 3 %}, tileSizeZ_ }{% endif %} ), cell_idx_t( {{2 * stages[0][1]}} ),
+                                  "Tiles of '{{class_name}}' have to be at least {{2 * stages[0][1]}} cells wide for the overlap of {{stages[0][1]}} cell(s)" );
+    {%- endif %}
+
+    // Overlap cells are written by every tile that reads them. Tiles are processed in {{2 ** spatial_dimensions}} colors by the parity of
+    // their index, such that tiles running concurrently never write the same cells. Each tile recomputes all values it
+    // reads, so the result only depends on the tile sizes, not on the number of threads or the order of the tiles.
+    for( int64_t color = 0; color < {{2 ** spatial_dimensions}}; ++color )
+    {
+        const int64_t cx = color % 2;
+        const int64_t cy = ( color / 2 ) % 2;
+        const int64_t cz = color / 4;
+        const int64_t colorTilesX = ( tilesX - cx + 1 ) / 2;
+        const int64_t colorTilesY = ( tilesY - cy + 1 ) / 2;
+        const int64_t colorTilesZ = ( tilesZ - cz + 1 ) / 2;
+
+        {% if openmp -%}
+        #pragma omp parallel for schedule(dynamic)
+        {% endif -%}
+        for( int64_t t = 0; t < colorTilesX * colorTilesY * colorTilesZ; ++t )
+        {
+            const cell_idx_t x = cell_idx_c( 2 * ( t % colorTilesX ) + cx ) * cell_idx_c( tileSizeX );
+            const cell_idx_t y = cell_idx_c( 2 * ( ( t / colorTilesX ) % colorTilesY ) + cy ) * cell_idx_c( tileSizeY );
+            const cell_idx_t z = cell_idx_c( 2 * ( t / ( colorTilesX * colorTilesY ) ) + cz ) * tileSizeZ_;
+            const CellInterval tile( x, y, z,
+                                     std::min( x + cell_idx_c( tileSizeX ), xSize ) - 1,
+                                     std::min( y + cell_idx_c( tileSizeY ), ySize ) - 1,
+                                     std::min( z + tileSizeZ_, zSize ) - 1 );
+            {%- for stage, overlap in stages %}
+            {
+                // stage {{loop.index0}}{% if overlap > 0 %}, extended by the {{overlap}} cell(s) read by later stages{% endif %}
+                CellInterval ci = tile;
+                {% if overlap > 0 -%}
+                ci.expand( Cell( {{overlap}}, {{overlap}}, {{overlap if spatial_dimensions == 3 else 0}} ) );
+                {% endif -%}
+                {{stage|generate_call(cell_interval='ci')|indent(16)}}
+            }
+            {%- endfor %}
+        }
+    }
+
+    {{kernel|generate_swaps|indent(4)}}
+}
+
+
+real_t {{class_name}}::cost( IBlock * block, real_t flopWeight, real_t byteWeight ) const
+{
+    // the sweep does not run on blocks without its fields
+    if( !block->isBlockDataAllocated( {{field}}ID ) )
+        return real_t( 0 );
+    {{kernel|generate_block_data_to_field_extraction(parameters=[field], layout_checks=False)|indent(4)}}
+    const real_t numberOfCells = real_t( {{field}}->xSize() * {{field}}->ySize() * {{field}}->zSize() );
+    return numberOfCells * ( flopWeight * flopsPerCell() + byteWeight * bytesPerCell() );
+}
+
+
+} // namespace {{namespace}}
+} // namespace walberla
+
+
+#if ( defined WALBERLA_CXX_COMPILER_IS_GNU ) || ( defined WALBERLA_CXX_COMPILER_IS_CLANG )
+#   pragma GCC diagnostic pop
+#endif
+
+#if ( defined WALBERLA_CXX_COMPILER_IS_INTEL )
+#pragma warning pop
+#endif
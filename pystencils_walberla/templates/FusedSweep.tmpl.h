@@ -0,0 +1,89 @@
+//======================================================================================================================
+//
+//  This file is part of waLBerla. waLBerla is free software: you can
+//  redistribute it and/or modify it under the terms of the GNU General Public
+//  License as published by the Free Software Foundation, either version 3 of
+//  the License, or (at your option) any later version.
+//
+//  waLBerla is distributed in the hope that it will be useful, but WITHOUT
+//  ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+//  FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+//  for more details.
+//
+//  You should have received a copy of the GNU General Public License along
+//  with waLBerla (see COPYING.txt). If not, see <http://www.gnu.org/licenses/>.
+//
+//! \\file {{class_name}}.h
+//! \\author pystencils
+//======================================================================================================================
+
+#pragma once
+#include "core/DataTypes.h"
+#include "field/GhostLayerField.h"
+#include "field/SwapableCompare.h"
+#include "domain_decomposition/BlockDataID.h"
+#include "domain_decomposition/IBlock.h"
+#include "domain_decomposition/StructuredBlockStorage.h"
+#include <set>
+
+#ifdef __GNUC__
+#define RESTRICT __restrict__
+#elif _MSC_VER
+#define RESTRICT __restrict
+#else
+#define RESTRICT
+#endif
+
+#if ( defined WALBERLA_CXX_COMPILER_IS_GNU ) || ( defined WALBERLA_CXX_COMPILER_IS_CLANG )
+#   pragma GCC diagnostic push
+#   pragma GCC diagnostic ignored "-Wunused-parameter"
+#endif
+
+namespace walberla {
+namespace {{namespace}} {
+
+
+/// Runs {{stages|length}} stage kernels one after another with overlapped tile temporal blocking:
+/// the block is processed tile by tile, each stage is computed on the tile extended by the overlap the later stages
+/// read, such that intermediate values stay in cache. Overlaps at block borders extend into the ghost layers.
+/// Tiles are processed in colors by the parity of their index, tiles of one color run concurrently with OpenMP.
+class {{class_name}}
+{
+public:
+    {{class_name}}( {{kernel|generate_constructor_parameters}}
+                    {%- for name, size in tile_sizes.items() %}, int64_t {{name}}_ = {{size}}{% endfor %})
+        : {{ kernel|generate_constructor_initializer_list }}
+          {%- for name in tile_sizes %}, {{name}}({{name}}_){% endfor %}
+    {};
+
+    {{ kernel| generate_destructor(class_name) |indent(4) }}
+
+    void operator() ( IBlock * block );
+
+    static std::function<void (IBlock*)> getSweep(const shared_ptr<{{class_name}}> & kernel) {
+        return [kernel](IBlock * b) { (*kernel)(b); };
+    }
+
+    /// Estimated cost of one sweep over the given block, e.g. to be used as block weight for load balancing.
+    /// The estimate sums up all stages, redundant computations in the tile overlaps are not taken into account.
+    /// Blocks on which the field is not allocated cost nothing.
+    real_t cost( IBlock * block, real_t flopWeight = real_t(1), real_t byteWeight = real_t(1) ) const;
+
+    static real_t flopsPerCell() { return real_t( {{flops_per_cell}} ); }
+    static real_t bytesPerCell() { return real_t( {{bytes_per_cell}} ); }
+
+    {{ kernel|generate_members|indent(4) }}
+    {% for name in tile_sizes -%}
+    int64_t {{name}};
+    {% endfor %}
+
+};
+
+
+} // namespace {{namespace}}
+} // namespace walberla
+
+
+#if ( defined WALBERLA_CXX_COMPILER_IS_GNU ) || ( defined WALBERLA_CXX_COMPILER_IS_CLANG )
+#   pragma GCC diagnostic pop
+#endif
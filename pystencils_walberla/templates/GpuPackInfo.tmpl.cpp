@@ -26,6 +26,129 @@ using walberla::stencil::Direction;
 {% for kernel in unpack_kernels.values() %}
 {{kernel|generate_definition(target)}}
 {% endfor %}
+{% if batched %}
+
+namespace internal_{{class_name}}_batched {
+
+// one (block, direction) entry of a batched launch
+struct Entry
+{
+    int64_t cellBegin;     // index of the first cell of the entry in the launch
+    int64_t numCells;
+    int64_t bufferOffset;  // start of the entry in the buffer, in elements
+    int64_t directionSet;
+    int64_t elementsPerCell;
+    int64_t xMin, yMin, zMin;
+    int64_t xSize, ySize;
+    {%- for name, num_strides in batched_fields %}
+    {{dtype}} * _data_{{name}};
+    int64_t {% for i in range(num_strides) %}_stride_{{name}}_{{i}}{{ ", " if not loop.last }}{% endfor %};
+    {%- endfor %}
+};
+
+// offset table of one launch, passed by value as kernel parameter
+struct Batch
+{
+    Entry entries[{{max_batch_entries}}];
+    int64_t numEntries;
+    int64_t numCells;
+};
+
+// number of packed values per cell for each direction set, only accessible on the host
+static const int64_t ELEMENTS_PER_CELL[] = { {% for n in elements_per_cell.values() %}{{n}}{{ ", " if not loop.last }}{% endfor %} };
+
+// direction set the values for a communication direction are packed with, -1 if nothing is packed
+static int64_t directionSet( Direction dir )
+{
+    switch( dir )
+    {
+        {%- for direction_set in batched_terms.keys() %}
+        {%- set set_index = loop.index0 %}
+        {%- for dir in direction_set %}
+        case stencil::{{dir}}:
+        {%- endfor %}
+            return {{set_index}};
+        {%- endfor %}
+        default:
+            return -1;
+    }
+}
+
+static __device__ const Entry & findEntry( const Batch & batch, int64_t cell )
+{
+    int64_t first = 0;
+    int64_t last = batch.numEntries - 1;
+    while( first < last )
+    {
+        const int64_t middle = ( first + last + 1 ) / 2;
+        if( batch.entries[middle].cellBegin <= cell )
+            first = middle;
+        else
+            last = middle - 1;
+    }
+    return batch.entries[first];
+}
+
+static __global__ __launch_bounds__(256) void pack( const Batch batch, {{dtype}} * RESTRICT buffer )
+{
+    const int64_t cell = int64_t( blockDim.x ) * blockIdx.x + threadIdx.x;
+    if( cell >= batch.numCells )
+        return;
+
+    const Entry & s = findEntry( batch, cell );
+    const int64_t c = cell - s.cellBegin;
+    const int64_t x = s.xMin + c % s.xSize;
+    const int64_t y = s.yMin + ( c / s.xSize ) % s.ySize;
+    const int64_t z = s.zMin + c / ( s.xSize * s.ySize );
+    {% if buffer_layout == 'fzyx' -%}
+    {{dtype}} * RESTRICT b = buffer + s.bufferOffset + c;
+    {%- else -%}
+    {{dtype}} * RESTRICT b = buffer + s.bufferOffset + s.elementsPerCell * c;
+    {%- endif %}
+
+    switch( s.directionSet )
+    {
+        {%- for terms in batched_terms.values() %}
+        case {{loop.index0}}:
+            {%- for term in terms %}
+            b[{{loop.index0}}{{ " * s.numCells" if buffer_layout == 'fzyx' }}] = {{term}};
+            {%- endfor %}
+            break;
+        {%- endfor %}
+    }
+}
+
+static __global__ __launch_bounds__(256) void unpack( const Batch batch, {{dtype}} * RESTRICT buffer )
+{
+    const int64_t cell = int64_t( blockDim.x ) * blockIdx.x + threadIdx.x;
+    if( cell >= batch.numCells )
+        return;
+
+    const Entry & s = findEntry( batch, cell );
+    const int64_t c = cell - s.cellBegin;
+    const int64_t x = s.xMin + c % s.xSize;
+    const int64_t y = s.yMin + ( c / s.xSize ) % s.ySize;
+    const int64_t z = s.zMin + c / ( s.xSize * s.ySize );
+    {% if buffer_layout == 'fzyx' -%}
+    const {{dtype}} * RESTRICT b = buffer + s.bufferOffset + c;
+    {%- else -%}
+    const {{dtype}} * RESTRICT b = buffer + s.bufferOffset + s.elementsPerCell * c;
+    {%- endif %}
+
+    switch( s.directionSet )
+    {
+        {%- for terms in batched_terms.values() %}
+        case {{loop.index0}}:
+            {%- for term in terms %}
+            {{term}} = b[{{loop.index0}}{{ " * s.numCells" if buffer_layout == 'fzyx' }}];
+            {%- endfor %}
+            break;
+        {%- endfor %}
+    }
+}
+
+} // namespace internal_{{class_name}}_batched
+{% endif %}
 
 
 
@@ -84,7 +207,7 @@ void {{class_name}}::unpack(Direction dir, unsigned char * byte_buffer, IBlock *
 
 uint_t {{class_name}}::size(stencil::Direction dir, IBlock * block)
 {
-    {{fused_kernel|generate_block_data_to_field_extraction(parameters_to_ignore=['buffer'])|indent(4)}}
+    {{fused_kernel|generate_block_data_to_field_extraction(parameters_to_ignore=['buffer'], layout_checks=False)|indent(4)}}
     CellInterval ci;
     {{field_name}}->getGhostRegion(dir, ci, 1, false);
 
@@ -104,6 +227,134 @@ uint_t {{class_name}}::size(stencil::Direction dir, IBlock * block)
     }
     return ci.numCells() * elementsPerCell * sizeof( {{dtype}} );
 }
+{% if batched %}
+
+
+void {{class_name}}::runBatched(const std::vector< BatchEntry > & entries, unsigned char * byte_buffer,
+                                cudaStream_t stream, bool packing)
+{
+    using namespace internal_{{class_name}}_batched;
+
+    {{dtype}} * buffer = reinterpret_cast<{{dtype}}*>(byte_buffer);
+    Batch batch;
+    batch.numEntries = 0;
+    batch.numCells = 0;
+    int64_t bufferOffset = 0;
+
+    auto launch = [&]() {
+        if( batch.numCells > 0 )
+        {
+            dim3 _block( 256, 1, 1 );
+            dim3 _grid( uint32_c( ( batch.numCells + 255 ) / 256 ), 1, 1 );
+            if( packing )
+                internal_{{class_name}}_batched::pack<<<_grid, _block, 0, stream>>>( batch, buffer );
+            else
+                internal_{{class_name}}_batched::unpack<<<_grid, _block, 0, stream>>>( batch, buffer );
+        }
+        buffer += bufferOffset;
+        bufferOffset = 0;
+        batch.numEntries = 0;
+        batch.numCells = 0;
+    };
+
+    for( auto & entry : entries )
+    {
+        IBlock * block = entry.first;
+        const Direction dir = entry.second;
+        {{fused_kernel|generate_block_data_to_field_extraction(parameters_to_ignore=['buffer'], layout_checks=False)|indent(8)}}
+        CellInterval ci;
+        int64_t set;
+        if( packing )
+        {
+            {{field_name}}->getSliceBeforeGhostLayer(dir, ci, 1, false);
+            set = directionSet( dir );
+        }
+        else
+        {
+            {{field_name}}->getGhostRegion(dir, ci, 1, false);
+            set = directionSet( stencil::inverseDir[dir] );
+        }
+        if( set < 0 || ci.empty() )
+            continue;
+
+        Entry & s = batch.entries[batch.numEntries++];
+        s.cellBegin = batch.numCells;
+        s.numCells = int64_c( ci.numCells() );
+        s.bufferOffset = bufferOffset;
+        s.directionSet = set;
+        s.elementsPerCell = ELEMENTS_PER_CELL[set];
+        s.xMin = ci.xMin();
+        s.yMin = ci.yMin();
+        s.zMin = ci.zMin();
+        s.xSize = int64_c( ci.xSize() );
+        s.ySize = int64_c( ci.ySize() );
+        {%- for name, num_strides in batched_fields %}
+        s._data_{{name}} = static_cast< {{dtype}} * >( {{name}}->dataAt(0, 0, 0, 0) );
+        {%- for stride in ['xStride()', 'yStride()', 'zStride()', 'fStride()'][:num_strides] %}
+        s._stride_{{name}}_{{loop.index0}} = int64_c( {{name}}->{{stride}} );
+        {%- endfor %}
+        {%- endfor %}
+
+        batch.numCells += int64_c( ci.numCells() );
+        bufferOffset += int64_c( ci.numCells() ) * s.elementsPerCell;
+
+        if( batch.numEntries == {{max_batch_entries}} )
+            launch();
+    }
+    launch();
+}
+
+
+void {{class_name}}::packBatched(const std::vector< BatchEntry > & entries, unsigned char * buffer, cudaStream_t stream)
+{
+    runBatched( entries, buffer, stream, true );
+}
+
+
+void {{class_name}}::unpackBatched(const std::vector< BatchEntry > & entries, unsigned char * buffer,
+                                   cudaStream_t stream)
+{
+    runBatched( entries, buffer, stream, false );
+}
+
+
+uint_t {{class_name}}::sizeBatched(const std::vector< BatchEntry > & entries)
+{
+    uint_t result = 0;
+    for( auto & entry : entries )
+        result += size( entry.second, entry.first );
+    return result;
+}
+
+
+void {{class_name}}::packBatched(const std::vector< stencil::Direction > & dirs, unsigned char * buffer,
+                                 IBlock * block, cudaStream_t stream)
+{
+    std::vector< BatchEntry > entries;
+    for( auto dir : dirs )
+        entries.emplace_back( block, dir );
+    runBatched( entries, buffer, stream, true );
+}
+
+
+void {{class_name}}::unpackBatched(const std::vector< stencil::Direction > & dirs, unsigned char * buffer,
+                                   IBlock * block, cudaStream_t stream)
+{
+    std::vector< BatchEntry > entries;
+    for( auto dir : dirs )
+        entries.emplace_back( block, dir );
+    runBatched( entries, buffer, stream, false );
+}
+
+
+uint_t {{class_name}}::sizeBatched(const std::vector< stencil::Direction > & dirs, IBlock * block)
+{
+    uint_t result = 0;
+    for( auto dir : dirs )
+        result += size( dir, block );
+    return result;
+}
+{% endif %}
 
 
 
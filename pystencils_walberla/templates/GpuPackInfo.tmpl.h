@@ -5,6 +5,10 @@
 #include "core/DataTypes.h"
 #include "domain_decomposition/IBlock.h"
 #include "cuda/communication/GeneratedGPUPackInfo.h"
+{% if batched %}
+#include <utility>
+#include <vector>
+{% endif %}
 
 
 {% if target is equalto 'cpu' -%}
@@ -36,8 +40,32 @@ public:
     virtual void pack  (stencil::Direction dir, unsigned char * buffer, IBlock * block, cudaStream_t stream);
     virtual void unpack(stencil::Direction dir, unsigned char * buffer, IBlock * block, cudaStream_t stream);
     virtual uint_t size  (stencil::Direction dir, IBlock * block);
+    {% if batched %}
+
+    /// One direction of one block, for unpacking the direction is the one passed to `unpack`
+    typedef std::pair< IBlock *, stencil::Direction > BatchEntry;
+
+    /// Packs all entries into one contiguous buffer, the entries are stored one after another. Within an entry the
+    /// cells are ordered with x fastest, like the buffers of `pack`, independent of the memory layout of the fields.
+    /// Up to {{max_batch_entries}} entries are processed by a single kernel launch.
+    void packBatched  (const std::vector< BatchEntry > & entries, unsigned char * buffer, cudaStream_t stream);
+    /// Unpacks a buffer that was filled by `packBatched` with the same entries
+    void unpackBatched(const std::vector< BatchEntry > & entries, unsigned char * buffer, cudaStream_t stream);
+    /// Size of the `packBatched` buffer in bytes
+    uint_t sizeBatched(const std::vector< BatchEntry > & entries);
+
+    void packBatched  (const std::vector< stencil::Direction > & dirs, unsigned char * buffer, IBlock * block,
+                       cudaStream_t stream);
+    void unpackBatched(const std::vector< stencil::Direction > & dirs, unsigned char * buffer, IBlock * block,
+                       cudaStream_t stream);
+    uint_t sizeBatched(const std::vector< stencil::Direction > & dirs, IBlock * block);
+    {% endif %}
 
 private:
+    {% if batched %}
+    void runBatched(const std::vector< BatchEntry > & entries, unsigned char * buffer, cudaStream_t stream, bool packing);
+
+    {% endif %}
     {{fused_kernel|generate_members(parameters_to_ignore=['buffer'])|indent(4)}}
 };
 
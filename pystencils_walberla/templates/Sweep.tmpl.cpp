@@ -54,6 +54,9 @@ namespace {{namespace}} {
 
 
 {{kernel|generate_definition(target)}}
+{% if first_touch_kernel is not none %}
+{{first_touch_kernel|generate_definition(target)}}
+{% endif %}
 
 void {{class_name}}::operator()( IBlock * block{%if target is equalto 'gpu'%} , cudaStream_t stream{% endif %} )
 {
@@ -82,6 +85,26 @@ void {{class_name}}::runOnCellInterval( const shared_ptr<StructuredBlockStorage>
 }
 
 
+real_t {{class_name}}::cost( IBlock * block, real_t flopWeight, real_t byteWeight ) const
+{
+    // the sweep does not run on blocks without its fields
+    if( !block->isBlockDataAllocated( {{field}}ID ) )
+        return real_t( 0 );
+    {{kernel|generate_block_data_to_field_extraction(parameters=[field], layout_checks=False)|indent(4)}}
+    const real_t numberOfCells = real_t( {{field}}->xSize() * {{field}}->ySize() * {{field}}->zSize() );
+    return numberOfCells * ( flopWeight * flopsPerCell() + byteWeight * bytesPerCell() );
+}
+{% if first_touch_kernel is not none %}
+
+
+void {{class_name}}::firstTouch( IBlock * block )
+{
+    {{kernel|generate_block_data_to_field_extraction|indent(4)}}
+    {{first_touch_kernel|generate_call|indent(4)}}
+}
+{% endif %}
+
+
 } // namespace {{namespace}}
 } // namespace walberla
 
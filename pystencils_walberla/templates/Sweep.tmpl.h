@@ -51,8 +51,10 @@ namespace {{namespace}} {
 class {{class_name}}
 {
 public:
-    {{class_name}}( {{kernel|generate_constructor_parameters}})
-        : {{ kernel|generate_constructor_initializer_list }}
+    {{class_name}}( {{kernel|generate_constructor_parameters(parameters_to_ignore=tile_size_names)}}
+                    {%- for name, size in tile_sizes.items() %}, int64_t {{name}}_ = {{size}}{% endfor %})
+        : {{ kernel|generate_constructor_initializer_list(parameters_to_ignore=tile_size_names) }}
+          {%- for name in tile_size_names %}, {{name}}({{name}}_){% endfor %}
     {};
 
     {{ kernel| generate_destructor(class_name) |indent(4) }}
@@ -79,7 +81,26 @@ public:
         };
     }
 
-    {{ kernel|generate_members|indent(4) }}
+    /// Estimated cost of one sweep over the given block, e.g. to be used as block weight for load balancing.
+    /// The estimate is the number of updated cells times the weighted per-cell floating point operations and
+    /// bytes of memory traffic of the generated kernel. Blocks on which the field is not allocated cost nothing.
+    real_t cost( IBlock * block, real_t flopWeight = real_t(1), real_t byteWeight = real_t(1) ) const;
+
+    static real_t flopsPerCell() { return real_t( {{flops_per_cell}} ); }
+    static real_t bytesPerCell() { return real_t( {{bytes_per_cell}} ); }
+    {% if first_touch_kernel is not none %}
+
+    /// Creates the temporary fields and writes zeros to them with the same loop structure and OpenMP schedule as
+    /// the sweep, such that their memory pages are placed in the NUMA domain of the thread that later updates them.
+    /// Call this before the first sweep. The fields of the block storage are not written: field::addToStorage
+    /// already initializes them when they are allocated, which decides their placement. Ghost layers are not written.
+    void firstTouch( IBlock * block );
+    {% endif %}
+
+    {{ kernel|generate_members(parameters_to_ignore=tile_size_names)|indent(4) }}
+    {% for name in tile_size_names -%}
+    int64_t {{name}};
+    {% endfor %}
 
 };
 
@@ -18,10 +18,14 @@
 //! \\author lbmpy
 //======================================================================================================================
 
+#include <algorithm>
 #include <cmath>
 
 #include "core/DataTypes.h"
 #include "core/Macros.h"
+{% if outer_kernel is not none %}
+#include "core/OpenMP.h"
+{% endif %}
 #include "{{class_name}}.h"
 
 
@@ -44,6 +48,12 @@ namespace walberla {
 namespace {{namespace}} {
 
 {{kernel|generate_definition(target)}}
+{% if first_touch_kernel is not none %}
+{{first_touch_kernel|generate_definition(target)}}
+{% endif %}
+{% if outer_kernel is not none %}
+{{outer_kernel|generate_definition(target)}}
+{% endif %}
 
 void {{class_name}}::operator() ( IBlock * block{%if target is equalto 'gpu'%} , cudaStream_t stream{% endif %} )
 {
@@ -72,12 +82,37 @@ void {{class_name}}::runOnCellInterval( const shared_ptr<StructuredBlockStorage>
 }
 
 
+real_t {{class_name}}::cost( IBlock * block, real_t flopWeight, real_t byteWeight ) const
+{
+    // the sweep does not run on blocks without its fields
+    if( !block->isBlockDataAllocated( {{field}}ID ) )
+        return real_t( 0 );
+    {{kernel|generate_block_data_to_field_extraction(parameters=[field], layout_checks=False)|indent(4)}}
+    const real_t numberOfCells = real_t( {{field}}->xSize() * {{field}}->ySize() * {{field}}->zSize() );
+    return numberOfCells * ( flopWeight * flopsPerCell() + byteWeight * bytesPerCell() );
+}
+{% if first_touch_kernel is not none %}
+
+
+void {{class_name}}::firstTouch( IBlock * block )
+{
+    {{kernel|generate_block_data_to_field_extraction|indent(4)}}
+    {{first_touch_kernel|generate_call|indent(4)}}
+}
+{% endif %}
+
+
 void {{class_name}}::inner( IBlock * block{%if target is equalto 'gpu'%} , cudaStream_t stream{% endif %} )
 {
     {{kernel|generate_block_data_to_field_extraction|indent(4)}}
 
     CellInterval inner = {{field}}->xyzSize();
-    inner.expand(Cell(-outerWidth_[0], -outerWidth_[1], -outerWidth_[2]));
+    inner.xMin() += outerWidthLower_[0];
+    inner.yMin() += outerWidthLower_[1];
+    inner.zMin() += outerWidthLower_[2];
+    inner.xMax() -= outerWidthUpper_[0];
+    inner.yMax() -= outerWidthUpper_[1];
+    inner.zMax() -= outerWidthUpper_[2];
 
     {{kernel|generate_call(stream='stream', cell_interval='inner')|indent(4)}}
 }
@@ -87,31 +122,10 @@ void {{class_name}}::outer( IBlock * block{%if target is equalto 'gpu'%} , cudaS
 {
     {{kernel|generate_block_data_to_field_extraction|indent(4)}}
 
-    if( layers_.size() == 0 )
-    {
-        CellInterval ci;
-
-        {{field}}->getSliceBeforeGhostLayer(stencil::T, ci, outerWidth_[2], false);
-        layers_.push_back(ci);
-        {{field}}->getSliceBeforeGhostLayer(stencil::B, ci, outerWidth_[2], false);
-        layers_.push_back(ci);
-
-        {{field}}->getSliceBeforeGhostLayer(stencil::N, ci, outerWidth_[1], false);
-        ci.expand(Cell(0, 0, -outerWidth_[2]));
-        layers_.push_back(ci);
-        {{field}}->getSliceBeforeGhostLayer(stencil::S, ci, outerWidth_[1], false);
-        ci.expand(Cell(0, 0, -outerWidth_[2]));
-        layers_.push_back(ci);
-
-        {{field}}->getSliceBeforeGhostLayer(stencil::E, ci, outerWidth_[0], false);
-        ci.expand(Cell(0, -outerWidth_[1], -outerWidth_[2]));
-        layers_.push_back(ci);
-        {{field}}->getSliceBeforeGhostLayer(stencil::W, ci, outerWidth_[0], false);
-        ci.expand(Cell(0, -outerWidth_[1], -outerWidth_[2]));
-        layers_.push_back(ci);
-    }
+    updateOuterRegion( {{field}}->xyzSize() );
 
     {%if target is equalto 'gpu'%}
+    if( concurrentOuterSlabs_ )
     {
         auto parallelSection_ = parallelStreams_.parallelSection( stream );
         for( auto & ci: layers_ )
@@ -121,6 +135,30 @@ void {{class_name}}::outer( IBlock * block{%if target is equalto 'gpu'%} , cudaS
             });
         }
     }
+    else
+    {
+        for( auto & ci: layers_ )
+        {
+            {{kernel|generate_call(stream='stream', cell_interval='ci')|indent(12)}}
+        }
+    }
+    {% elif outer_kernel is not none %}
+    if( concurrentOuterSlabs_ )
+    {
+        #pragma omp parallel for schedule(dynamic)
+        for( int64_t i = 0; i < int64_c( chunks_.size() ); ++i )
+        {
+            const CellInterval & ci = chunks_[ uint_c( i ) ];
+            {{outer_kernel|generate_call(cell_interval='ci')|indent(12)}}
+        }
+    }
+    else
+    {
+        for( auto & ci: layers_ )
+        {
+            {{kernel|generate_call(cell_interval='ci')|indent(12)}}
+        }
+    }
     {% else %}
     for( auto & ci: layers_ )
     {
@@ -132,6 +170,64 @@ void {{class_name}}::outer( IBlock * block{%if target is equalto 'gpu'%} , cudaS
 }
 
 
+void {{class_name}}::updateOuterRegion( const CellInterval & fieldSize )
+{
+    if( !layers_.empty() && fieldSize == layersFieldSize_ )
+        return;
+
+    layersFieldSize_ = fieldSize;
+    layers_.clear();
+
+    const Cell & lower = outerWidthLower_;
+    const Cell & upper = outerWidthUpper_;
+    const CellInterval & f = fieldSize;
+
+    // T, B: complete xy-planes
+    layers_.emplace_back( f.xMin(), f.yMin(), f.zMax() - upper[2] + 1, f.xMax(), f.yMax(), f.zMax() );
+    layers_.emplace_back( f.xMin(), f.yMin(), f.zMin(), f.xMax(), f.yMax(), f.zMin() + lower[2] - 1 );
+
+    // N, S: without the T, B slabs
+    const cell_idx_t zMin = f.zMin() + lower[2];
+    const cell_idx_t zMax = f.zMax() - upper[2];
+    layers_.emplace_back( f.xMin(), f.yMax() - upper[1] + 1, zMin, f.xMax(), f.yMax(), zMax );
+    layers_.emplace_back( f.xMin(), f.yMin(), zMin, f.xMax(), f.yMin() + lower[1] - 1, zMax );
+
+    // E, W: without the T, B, N, S slabs
+    const cell_idx_t yMin = f.yMin() + lower[1];
+    const cell_idx_t yMax = f.yMax() - upper[1];
+    layers_.emplace_back( f.xMax() - upper[0] + 1, yMin, zMin, f.xMax(), yMax, zMax );
+    layers_.emplace_back( f.xMin(), yMin, zMin, f.xMin() + lower[0] - 1, yMax, zMax );
+
+    auto isEmpty = []( const CellInterval & ci ) { return ci.empty(); };
+    layers_.erase( std::remove_if( layers_.begin(), layers_.end(), isEmpty ), layers_.end() );
+    {% if outer_kernel is not none %}
+
+    // split the slabs along y or z into chunks of similar size, a few per thread for dynamic load balancing
+    chunks_.clear();
+    uint_t numberOfCells = 0;
+    for( auto & layer : layers_ )
+        numberOfCells += layer.numCells();
+    const uint_t chunkSize = std::max( numberOfCells / ( uint_t( 4 ) * uint_c( omp_get_max_threads() ) ), uint_t( 1 ) );
+
+    for( auto & layer : layers_ )
+    {
+        const bool splitZ = layer.zSize() >= layer.ySize();
+        const cell_idx_t begin = splitZ ? layer.zMin() : layer.yMin();
+        const cell_idx_t extent = cell_idx_c( splitZ ? layer.zSize() : layer.ySize() );
+        const uint_t chunksForSize = std::max( layer.numCells() / chunkSize, uint_t( 1 ) );
+        const cell_idx_t numberOfChunks = std::min( extent, cell_idx_c( chunksForSize ) );
+        for( cell_idx_t c = 0; c < numberOfChunks; ++c )
+        {
+            CellInterval chunk = layer;
+            ( splitZ ? chunk.zMin() : chunk.yMin() ) = begin + extent * c / numberOfChunks;
+            ( splitZ ? chunk.zMax() : chunk.yMax() ) = begin + extent * ( c + 1 ) / numberOfChunks - 1;
+            chunks_.push_back( chunk );
+        }
+    }
+    {% endif %}
+}
+
+
 } // namespace {{namespace}}
 } // namespace walberla
 
@@ -53,8 +53,10 @@ namespace {{namespace}} {
 class {{class_name}}
 {
 public:
-    {{class_name}}( {{kernel|generate_constructor_parameters}}, const Cell & outerWidth=Cell(1, 1, 1))
-        : {{ kernel|generate_constructor_initializer_list }}, outerWidth_(outerWidth)
+    {{class_name}}( {{kernel|generate_constructor_parameters(parameters_to_ignore=tile_size_names)}}, const Cell & outerWidth=Cell(1, 1, 1)
+                    {%- for name, size in tile_sizes.items() %}, int64_t {{name}}_ = {{size}}{% endfor %})
+        : {{ kernel|generate_constructor_initializer_list(parameters_to_ignore=tile_size_names) }}, outerWidthLower_(outerWidth), outerWidthUpper_(outerWidth)
+          {%- for name in tile_size_names %}, {{name}}({{name}}_){% endfor %}
     {};
 
     {{ kernel| generate_destructor(class_name) |indent(4) }}
@@ -83,6 +85,22 @@ public:
         };
     }
 
+    /// Estimated cost of one sweep over the given block, e.g. to be used as block weight for load balancing.
+    /// The estimate is the number of updated cells times the weighted per-cell floating point operations and
+    /// bytes of memory traffic of the generated kernel. Blocks on which the field is not allocated cost nothing.
+    real_t cost( IBlock * block, real_t flopWeight = real_t(1), real_t byteWeight = real_t(1) ) const;
+
+    static real_t flopsPerCell() { return real_t( {{flops_per_cell}} ); }
+    static real_t bytesPerCell() { return real_t( {{bytes_per_cell}} ); }
+    {% if first_touch_kernel is not none %}
+
+    /// Creates the temporary fields and writes zeros to them with the same loop structure and OpenMP schedule as
+    /// the sweep, such that their memory pages are placed in the NUMA domain of the thread that later updates them.
+    /// Call this before the first sweep. The fields of the block storage are not written: field::addToStorage
+    /// already initializes them when they are allocated, which decides their placement. Ghost layers are not written.
+    void firstTouch( IBlock * block );
+    {% endif %}
+
 
     void inner( IBlock * block{%if target is equalto 'gpu'%} , cudaStream_t stream = 0{% endif %} );
     void outer( IBlock * block{%if target is equalto 'gpu'%} , cudaStream_t stream = 0{% endif %} );
@@ -92,15 +110,42 @@ public:
         parallelStreams_.setStreamPriority(priority);
         {%endif%}
     }
-    {{kernel|generate_members|indent(4)}}
+
+    /// Sets the width of the outer region per face: lowerWidth for the W, S, B faces, upperWidth for the E, N, T faces
+    void setOuterWidth( const Cell & lowerWidth, const Cell & upperWidth ) {
+        outerWidthLower_ = lowerWidth;
+        outerWidthUpper_ = upperWidth;
+        layers_.clear();
+    }
+
+    /// Runs the six outer slabs concurrently (default) or one after another.
+    /// On GPU concurrent slabs run on parallel streams. On CPU with OpenMP concurrent slabs are split into chunks,
+    /// that are scheduled dynamically in one parallel region, otherwise each slab is updated by the parallel loops
+    /// of the kernel. Without OpenMP the slabs are always updated one after another.
+    void setOuterSlabsConcurrent( bool concurrent ) {
+        concurrentOuterSlabs_ = concurrent;
+    }
+    {{kernel|generate_members(parameters_to_ignore=tile_size_names)|indent(4)}}
 
 private:
     {%if target is equalto 'gpu'%}
     cuda::ParallelStreams parallelStreams_;
     {% endif %}
 
-    Cell outerWidth_;
+    /// (Re)builds the cached outer slabs, if the field size or the outer widths changed
+    void updateOuterRegion( const CellInterval & fieldSize );
+
+    Cell outerWidthLower_;
+    Cell outerWidthUpper_;
+    CellInterval layersFieldSize_;
     std::vector<CellInterval> layers_;
+    {% if outer_kernel is not none %}
+    std::vector<CellInterval> chunks_;
+    {% endif %}
+    bool concurrentOuterSlabs_ = true;
+    {% for name in tile_size_names -%}
+    int64_t {{name}};
+    {% endfor %}
 };
 
 
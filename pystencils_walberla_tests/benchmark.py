@@ -0,0 +1,310 @@
+"""
+Benchmark suite for the code generator itself.
+
+Measures for each generation entry point the wall time, the peak (Python) memory and the number of
+`pystencils.create_kernel` invocations on realistic inputs. Results are compared against stored baselines
+in ``benchmark_baseline.json``. To make baselines comparable across machines and robust against a machine's
+varying speed, every run of a benchmark is preceded by a calibration workload (plain sympy expansion and CSE,
+independent of this package). The benchmarks are compared by their relative time, the median ratio of benchmark and
+calibration wall time. The allowed slowdown grows with the measured run-to-run variation, but a slowdown by half is
+always reported.
+
+Additionally the fixed overhead of generation scripts is reported: the import time of the package in a fresh
+interpreter and the time to render one class without creating any kernel.
+
+Usage:
+    python -m pystencils_walberla_tests.benchmark                     # run and compare against baseline
+    python -m pystencils_walberla_tests.benchmark --update-baseline   # run and store results as new baseline
+    python -m pystencils_walberla_tests.benchmark --overhead          # only report import and per-class overhead
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import product
+from unittest import mock
+
+import sympy as sp
+from sympy.core.cache import clear_cache
+
+import pystencils as ps
+import pystencils_walberla.codegen
+from pystencils_walberla import (
+    generate_block_weights, generate_pack_info_for_field, generate_pack_info_from_kernel, generate_sweep)
+from pystencils_walberla.cmake_integration import ManualCodeGenerationContext
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+# ---------------------------------- Inputs ----------------------------------------------------------------------------
+
+
+def lbm_stencil(name):
+    """Returns (directions, weights) of a D3Q19 or D3Q27 lattice."""
+    if name == 'D3Q19':
+        directions = [d for d in product(*[(-1, 0, 1)] * 3) if sum(abs(e) for e in d) <= 2]
+        weight_of_length = {0: sp.Rational(1, 3), 1: sp.Rational(1, 18), 2: sp.Rational(1, 36)}
+    elif name == 'D3Q27':
+        directions = list(product(*[(-1, 0, 1)] * 3))
+        weight_of_length = {0: sp.Rational(8, 27), 1: sp.Rational(2, 27), 2: sp.Rational(1, 54),
+                            3: sp.Rational(1, 216)}
+    else:
+        raise ValueError("Unknown stencil " + name)
+    directions.sort(key=lambda d: (sum(abs(e) for e in d), d))
+    weights = [weight_of_length[sum(abs(e) for e in d)] for d in directions]
+    return directions, weights
+
+
+def lbm_collide_stream_assignments(stencil_name, dtype='float64'):
+    """Pull-type stream & BGK collide kernel, similar in size to what lbmpy generates for simple collision models."""
+    directions, weights = lbm_stencil(stencil_name)
+    q = len(directions)
+    src, dst = ps.fields("src({q}), src_tmp({q}): {dtype}[3D]".format(q=q, dtype=dtype))
+    omega = sp.Symbol("omega")
+
+    pdfs = sp.symbols("f_:{}".format(q))
+    rho, u = sp.Symbol("rho"), sp.symbols("u_:3")
+    subexpressions = [ps.Assignment(f, src[tuple(-e for e in d)](i)) for i, (f, d) in enumerate(zip(pdfs, directions))]
+    subexpressions.append(ps.Assignment(rho, sum(pdfs)))
+    for j in range(3):
+        subexpressions.append(ps.Assignment(u[j], sum(d[j] * f for d, f in zip(directions, pdfs)) / rho))
+
+    main_assignments = []
+    u_sq = sum(u_j ** 2 for u_j in u)
+    for i, (d, w) in enumerate(zip(directions, weights)):
+        c_u = sum(d_j * u_j for d_j, u_j in zip(d, u))
+        f_eq = w * rho * (1 + 3 * c_u + sp.Rational(9, 2) * c_u ** 2 - sp.Rational(3, 2) * u_sq)
+        main_assignments.append(ps.Assignment(dst(i), pdfs[i] + omega * (f_eq - pdfs[i])))
+    return ps.AssignmentCollection(main_assignments, subexpressions), src, dst
+
+
+def phase_field_assignments(radius=2, dtype='float64'):
+    """Allen-Cahn type update with a wide (2 * radius + 1)^3 isotropic Laplacian."""
+    phi, phi_tmp = ps.fields("phi, phi_tmp: {}[3D]".format(dtype))
+    dt, kappa = sp.symbols("dt kappa")
+    offsets = [o for o in product(*[range(-radius, radius + 1)] * 3) if any(o)]
+    laplacian = sum(sp.Rational(1, sum(e * e for e in o)) * (phi[o] - phi[0, 0, 0]) for o in offsets)
+    update = phi[0, 0, 0] + dt * (kappa * laplacian - phi[0, 0, 0] ** 3 + phi[0, 0, 0])
+    return [ps.Assignment(phi_tmp[0, 0, 0], update)], phi, phi_tmp
+
+
+def _sweep_lbm(stencil_name):
+    def run(ctx):
+        ac, src, dst = lbm_collide_stream_assignments(stencil_name)
+        generate_sweep(ctx, 'LbmSweep' + stencil_name, ac, field_swaps=[(src, dst)])
+    return run
+
+
+def _sweep_phase_field(ctx):
+    assignments, phi, phi_tmp = phase_field_assignments()
+    generate_sweep(ctx, 'PhaseFieldSweep', assignments, field_swaps=[(phi, phi_tmp)])
+
+
+def _pack_info_for_field(ctx):
+    pdfs = ps.fields("pdfs(27): [3D]")
+    generate_pack_info_for_field(ctx, 'PackInfoD3Q27', pdfs)
+
+
+def _pack_info_from_kernel(stencil_name):
+    def run(ctx):
+        ac, _, _ = lbm_collide_stream_assignments(stencil_name)
+        generate_pack_info_from_kernel(ctx, 'PackInfo' + stencil_name, ac)
+    return run
+
+
+BENCHMARKS = OrderedDict([
+    ('generate_sweep/lbm_d3q19', _sweep_lbm('D3Q19')),
+    ('generate_sweep/lbm_d3q27', _sweep_lbm('D3Q27')),
+    ('generate_sweep/phase_field_r2', _sweep_phase_field),
+    ('generate_pack_info_for_field/d3q27', _pack_info_for_field),
+    ('generate_pack_info_from_kernel/lbm_d3q19', _pack_info_from_kernel('D3Q19')),
+    ('generate_pack_info_from_kernel/lbm_d3q27', _pack_info_from_kernel('D3Q27')),
+])
+
+
+# ---------------------------------- Measurement -----------------------------------------------------------------------
+
+
+@contextmanager
+def count_create_kernel_calls():
+    """Counts calls to `create_kernel` and `create_staggered_kernel` made by the generation functions."""
+    counter = {'create_kernel': 0}
+
+    def counting(func):
+        def wrapper(*args, **kwargs):
+            counter['create_kernel'] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    module = pystencils_walberla.codegen
+    with mock.patch.object(module, 'create_kernel', counting(module.create_kernel)), \
+            mock.patch.object(module, 'create_staggered_kernel', counting(module.create_staggered_kernel)):
+        yield counter
+
+
+def calibration_workload():
+    x, y, z, w = sp.symbols("x y z w")
+    polynomial = sp.expand((x + y + z + w + 1) ** 6)
+    sp.cse([polynomial, polynomial.subs(x, y / 2)])
+
+
+def timed(func, *args):
+    """Wall time [s] of calling func, with a cleared sympy cache to measure the cost of a fresh generation script."""
+    clear_cache()
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run_benchmark(name, repeat=5):
+    """Runs a single benchmark and returns dict with median wall time [s] of the benchmark and of the calibration
+    workload, the median relative time and its relative spread, peak memory [MiB] and create_kernel calls.
+
+    Wall time is measured without memory tracing, since tracing slows down execution considerably. The relative time
+    is the ratio of the benchmark to the calibration wall time of the same repetition. Its spread is the median
+    absolute deviation of the repetitions relative to the median.
+    """
+    benchmark = BENCHMARKS[name]
+    calibration_workload()  # the first run is slower, e.g. due to lazily initialized parts of sympy
+    wall_times, calibration_times = [], []
+    for _ in range(repeat):
+        calibration_times.append(timed(calibration_workload))
+        with count_create_kernel_calls() as counter:
+            wall_times.append(timed(benchmark, ManualCodeGenerationContext()))
+
+    clear_cache()
+    tracemalloc.start()
+    benchmark(ManualCodeGenerationContext())
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    relative_times = [t / c for t, c in zip(wall_times, calibration_times)]
+    relative_time = statistics.median(relative_times)
+    return {'wall_time': statistics.median(wall_times),
+            'calibration_time': statistics.median(calibration_times),
+            'relative_time': relative_time,
+            'relative_time_spread': statistics.median(abs(t - relative_time) for t in relative_times) / relative_time,
+            'peak_memory_mib': peak_memory / 2 ** 20,
+            'create_kernel_calls': counter['create_kernel']}
+
+
+IMPORT_STATEMENTS = OrderedDict([
+    ('import pystencils_walberla', "import pystencils_walberla"),
+    ('import CodeGeneration', "from pystencils_walberla import CodeGeneration"),
+    ('import generate_sweep', "from pystencils_walberla import generate_sweep"),
+])
+
+
+def measure_import_time(statement, repeat=5):
+    """Best wall time [s] of a fresh interpreter running the statement, minus the bare interpreter startup."""
+    def best_time(code):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, '-c', code])
+            times.append(time.perf_counter() - start)
+        return min(times)
+    return max(best_time(statement) - best_time("pass"), 0.0)
+
+
+def measure_per_class_overhead(repeat=100):
+    """Average wall time [s] of rendering a class that needs no kernel, i.e. the fixed cost of every generate call."""
+    ctx = ManualCodeGenerationContext()
+    generate_block_weights(ctx, 'Weights', ['SweepA', 'SweepB'])  # first call may compile and cache templates
+    start = time.perf_counter()
+    for _ in range(repeat):
+        generate_block_weights(ctx, 'Weights', ['SweepA', 'SweepB'])
+    return (time.perf_counter() - start) / repeat
+
+
+def report_overhead():
+    for name, statement in IMPORT_STATEMENTS.items():
+        print("{:<45} {:>12.3f} s".format(name, measure_import_time(statement)))
+    print("{:<45} {:>12.3f} ms".format("per-class overhead", 1e3 * measure_per_class_overhead()))
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2, spread_factor=2.0, max_spread=0.25):
+    """Returns list of human readable regressions.
+
+    Memory and the relative time regress if they exceed the baseline by more than the relative tolerance. The
+    relative time additionally may exceed the baseline by `spread_factor` times the larger relative spread of the
+    current and the baseline runs, at most by `max_spread`, such that noisy machines do not report regressions, but
+    large slowdowns are always reported. The number of create_kernel invocations is deterministic and has to match
+    exactly.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        spread = max(result['relative_time_spread'], base['relative_time_spread'])
+        thresholds = {'relative_time': tolerance + min(spread_factor * spread, max_spread),
+                      'peak_memory_mib': tolerance}
+        for key, threshold in thresholds.items():
+            if result[key] > (1 + threshold) * base[key]:
+                regressions.append("{}: {} {:.3f} > (1 + {:.2f}) * {:.3f}".format(
+                    name, key, result[key], threshold, base[key]))
+        if result['create_kernel_calls'] != base['create_kernel_calls']:
+            regressions.append("{}: create_kernel_calls {} != {}".format(name, result['create_kernel_calls'],
+                                                                         base['create_kernel_calls']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*', help="names of benchmarks to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="number of repetitions, medians are reported")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="relative amount by which relative time and memory may exceed the baseline")
+    parser.add_argument('--spread-factor', type=float, default=2.0,
+                        help="multiple of the relative run-to-run spread, that wall time may additionally exceed "
+                             "the baseline by")
+    parser.add_argument('--max-spread', type=float, default=0.25,
+                        help="upper limit of the relative allowance for run-to-run spread")
+    parser.add_argument('--update-baseline', action='store_true', help="store results as new baseline")
+    parser.add_argument('--overhead', action='store_true', help="only report import time and per-class overhead")
+    args = parser.parse_args(argv)
+
+    if args.overhead:
+        report_overhead()
+        return 0
+
+    names = args.benchmarks or list(BENCHMARKS.keys())
+    results = OrderedDict()
+    print("{:<45} {:>10} {:>10} {:>10} {:>8} {:>11} {:>14}".format(
+        "benchmark", "time [s]", "calib [s]", "relative", "spread", "peak [MiB]", "create_kernel"))
+    for name in names:
+        results[name] = run_benchmark(name, args.repeat)
+        print("{:<45} {wall_time:>10.3f} {calibration_time:>10.3f} {relative_time:>10.3f} {spread:>7.1f}% "
+              "{peak_memory_mib:>11.1f} {create_kernel_calls:>14}".format(
+                  name, spread=100 * results[name]['relative_time_spread'], **results[name]))
+
+    if args.update_baseline:
+        baseline = load_baseline()
+        baseline.update(results)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write("\n")
+        return 0
+
+    regressions = compare_to_baseline(results, load_baseline(), args.tolerance, args.spread_factor, args.max_spread)
+    for r in regressions:
+        print("REGRESSION " + r)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
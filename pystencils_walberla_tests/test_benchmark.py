@@ -0,0 +1,55 @@
+import subprocess
+import sys
+import unittest
+
+from pystencils_walberla.cmake_integration import ManualCodeGenerationContext
+from pystencils_walberla_tests.benchmark import (
+    BENCHMARKS, compare_to_baseline, count_create_kernel_calls, load_baseline)
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    @staticmethod
+    def test_create_kernel_calls_match_baseline():
+        # timings are machine dependent and only checked by running the benchmark module directly,
+        # the number of create_kernel invocations however has to match the stored baseline exactly
+        baseline = load_baseline()
+        for name, benchmark in BENCHMARKS.items():
+            with count_create_kernel_calls() as counter:
+                benchmark(ManualCodeGenerationContext())
+            assert counter['create_kernel'] == baseline[name]['create_kernel_calls'], name
+
+    @staticmethod
+    def test_tolerance_follows_spread():
+        def result(relative_time, spread, memory=1.0):
+            return {'b': {'relative_time': relative_time, 'relative_time_spread': spread, 'peak_memory_mib': memory,
+                          'create_kernel_calls': 1}}
+
+        base = result(1.0, 0.01)
+        assert len(compare_to_baseline(result(1.4, 0.01), base)) == 1
+        # on a noisy machine the same slowdown is within the measured variation
+        assert compare_to_baseline(result(1.4, 0.1), base) == []
+        # but the allowance for noise is limited, a slowdown by half is always reported
+        assert len(compare_to_baseline(result(1.5, 1.0), base)) == 1
+        assert len(compare_to_baseline(result(1.0, 0.01, memory=1.4), base)) == 1
+
+    @staticmethod
+    def test_relative_time_is_compared():
+        base = {'b': {'wall_time': 1.0, 'relative_time': 2.0, 'relative_time_spread': 0.01, 'peak_memory_mib': 1.0,
+                      'create_kernel_calls': 1}}
+        # a slower machine takes longer for the benchmark and the calibration workload alike
+        slower_machine = {'b': dict(base['b'], wall_time=2.0)}
+        assert compare_to_baseline(slower_machine, base) == []
+        slower_code = {'b': dict(base['b'], relative_time=4.0)}
+        assert len(compare_to_baseline(slower_code, base)) == 1
+
+    @staticmethod
+    def test_lazy_import():
+        # importing the package (e.g. for CMake's CodeGeneration) must not pull in sympy, pystencils or jinja2
+        code = ("import sys, pystencils_walberla; "
+                "print(any(m in sys.modules for m in ('sympy', 'pystencils', 'jinja2')))")
+        assert subprocess.check_output([sys.executable, '-c', code]).decode().strip() == 'False'
+
+        import pystencils_walberla
+        from pystencils_walberla.codegen import generate_sweep
+        assert pystencils_walberla.generate_sweep is generate_sweep
@@ -3,8 +3,11 @@ import unittest
 import sympy as sp
 
 import pystencils as ps
-from pystencils_walberla import generate_sweep
+from pystencils_walberla import (
+    generate_block_weights, generate_checkpoint, generate_communication_hiding_timestep, generate_pack_info,
+    generate_pack_info_for_field, generate_pack_info_from_kernel, generate_pack_info_from_kernels, generate_sweep)
 from pystencils_walberla.cmake_integration import ManualCodeGenerationContext
+from pystencils_walberla.symbolic_optimizations import STAGES, optimize_assignments
 
 
 class CodegenTest(unittest.TestCase):
@@ -50,3 +53,458 @@ class CodegenTest(unittest.TestCase):
                             assert 'float ' not in file_to_test
                         else:
                             assert 'double ' not in file_to_test
+
+    @staticmethod
+    def test_mixed_precision():
+        with ManualCodeGenerationContext(double_accuracy=True) as ctx:
+            src, dst = ps.fields("src(2), src_tmp(2): float64[3D]")
+            omega = sp.symbols("omega")
+            assignments = [ps.Assignment(dst(0), src[1, 0, 0](0) * src(1)),
+                           ps.Assignment(dst(1), omega * src[-1, 0, 0](1))]
+            generate_sweep(ctx, 'MixedPrecision', assignments, field_swaps=[(src, dst)],
+                           storage_data_type={src: 'float32'})
+            generate_pack_info_from_kernel(ctx, 'MixedPrecisionPackInfo', assignments, storage_data_type='float32')
+
+            sweep_source = ctx.files['MixedPrecision.cpp']
+            assert 'GhostLayerField<float, 2>' in sweep_source
+            assert 'GhostLayerField<double' not in sweep_source
+            assert 'float * RESTRICT _data_src_tmp' in sweep_source
+            # loads are converted to the compute type before any arithmetic is done
+            assert 'const double xi_' in sweep_source
+            assert 'double omega' in ctx.files['MixedPrecision.h']
+            assert 'double' not in ctx.files['MixedPrecisionPackInfo.cpp']
+
+            # switching off vectorization for the mixed kernel does not change the caller's options
+            vectorize_info = {'instruction_set': 'avx'}
+            generate_sweep(ctx, 'MixedPrecisionAvx', assignments, field_swaps=[(src, dst)],
+                           storage_data_type='float32', cpu_vectorize_info=vectorize_info)
+            assert vectorize_info == {'instruction_set': 'avx'}
+
+    def test_symbolic_optimizations(self):
+        src, dst = ps.fields("src, src_tmp: float64[3D]")
+        h, w = sp.symbols("h w")
+        assignments = [ps.Assignment(dst[0, 0, 0], (src[1, 0, 0] + src[-1, 0, 0]) / (6 * h ** 2) +
+                                     src[0, 1, 0] / h ** 2 + sp.sqrt(2) / 3 * w * (1 - w) * src[0, 0, 0])]
+        optimized, report = optimize_assignments(assignments)
+        assert [stage for stage, _ in report] == ['input'] + list(STAGES.keys())
+        ops_before, ops_after = report[0][1], report[-1][1]
+        assert ops_after['divs'] == 0 < ops_before['divs']
+        assert ops_after['muls'] < ops_before['muls']
+
+        with ManualCodeGenerationContext() as ctx:
+            with self.assertLogs('pystencils_walberla', level='INFO') as logs:
+                generate_sweep(ctx, 'Optimized', assignments, field_swaps=[(src, dst)], symbolic_optimizations=True)
+            output = "\n".join(logs.output)
+            assert "Operations per cell of 'Optimized'" in output
+            assert 'hoisting' in output
+            source = ctx.files['Optimized.cpp']
+            # parameter dependent terms are evaluated outside the loop nest
+            assert source.index('1 / (h*h)') < source.index('for (')
+
+        # loop counters change from cell to cell: only dx**2 is hoisted, the products with the coordinates are not
+        dx = sp.Symbol("dx")
+        coordinates = [ps.Assignment(dst[0, 0, 0], src[0, 0, 0] * (ps.x_ * dx) * (ps.y_ * dx))]
+        optimized, report = optimize_assignments(coordinates)
+        assert [a.rhs for a in optimized.subexpressions] == [dx ** 2]
+        assert report[-1][1]['muls'] == 3
+
+    @staticmethod
+    def test_cost_estimates():
+        with ManualCodeGenerationContext() as ctx:
+            src, dst = ps.fields("src, src_tmp: float64[3D]")
+
+            @ps.kernel
+            def kernel_func():
+                dst[0, 0, 0] @= (src[1, 0, 0] + src[-1, 0, 0] + src[0, 1, 0] + src[0, -1, 0]) * 0.25
+
+            generate_sweep(ctx, 'Jacobi', kernel_func, field_swaps=[(src, dst)])
+            generate_sweep(ctx, 'JacobiInnerOuter', kernel_func, field_swaps=[(src, dst)], inner_outer_split=True)
+            generate_block_weights(ctx, 'TimestepWeights', ['Jacobi', 'JacobiInnerOuter'])
+
+            for class_name in ('Jacobi', 'JacobiInnerOuter'):
+                # sympy distributes the factor: 3 additions and 4 multiplications, reading src and writing src_tmp
+                assert 'static real_t flopsPerCell() { return real_t( 7 ); }' in ctx.files[class_name + '.h']
+                assert 'static real_t bytesPerCell() { return real_t( 16 ); }' in ctx.files[class_name + '.h']
+                assert 'real_t {}::cost( IBlock * block'.format(class_name) in ctx.files[class_name + '.cpp']
+
+            weights = ctx.files['TimestepWeights.h']
+            assert '#include "Jacobi.h"' in weights and '#include "JacobiInnerOuter.h"' in weights
+            assert 'return sweep1_->cost( block, flopWeight_, byteWeight_ );' in weights
+
+    @staticmethod
+    def test_block_weights_of_different_sweeps():
+        # a fluid sweep on some blocks, a solid sweep on others: the fields are only allocated where the sweep runs
+        fluid, fluid_tmp = ps.fields("fluid, fluid_tmp: float64[3D]")
+        solid, solid_tmp = ps.fields("solid, solid_tmp: float64[3D]")
+        with ManualCodeGenerationContext() as ctx:
+            generate_sweep(ctx, 'FluidSweep', [ps.Assignment(fluid_tmp.center, fluid[1, 0, 0] + fluid[-1, 0, 0])],
+                           field_swaps=[(fluid, fluid_tmp)])
+            generate_sweep(ctx, 'SolidSweep', [ps.Assignment(solid_tmp.center, 2 * solid.center)],
+                           field_swaps=[(solid, solid_tmp)], inner_outer_split=True)
+            generate_block_weights(ctx, 'Weights', ['FluidSweep', 'SolidSweep'])
+
+            for class_name, field in (('FluidSweep', 'fluid'), ('SolidSweep', 'solid')):
+                cpp = ctx.files[class_name + '.cpp']
+                cost = cpp[cpp.index('::cost('):]
+                allocation_check = 'if( !block->isBlockDataAllocated( {}ID ) )\n        return real_t( 0 );'
+                assert cost.index(allocation_check.format(field)) < cost.index('uncheckedFastGetData')
+
+            weights = ctx.files['Weights.h']
+            # each sweep contributes only on blocks selected by the block state
+            assert 'void setSelectors( uint_t sweep, const Set< SUID > & requiredSelectors,' in weights
+            cost = weights[weights.index('double cost( uint_t sweep, IBlock * block ) const'):]
+            assert cost.index('if( !isSelected( sweep, block->getState() ) )') < cost.index('sweep0_->cost(')
+            # blocks that do not exist yet get the average cost of the sweeps selected by their state
+            assert 'if( numberOfBlocks[i] > 0 && isSelected( i, phantom->getState() ) )' in weights
+
+    @staticmethod
+    def test_first_touch():
+        src, dst = ps.fields("src, src_tmp: float64[3D]")
+        assignments = [ps.Assignment(dst[0, 0, 0], (src[1, 0, 0] + src[-1, 0, 0]) * 0.5)]
+
+        with ManualCodeGenerationContext(openmp=True) as ctx:
+            generate_sweep(ctx, 'Jacobi', assignments, field_swaps=[(src, dst)])
+            generate_sweep(ctx, 'JacobiInnerOuter', assignments, field_swaps=[(src, dst)], inner_outer_split=True)
+            for class_name in ('Jacobi', 'JacobiInnerOuter'):
+                assert 'void firstTouch( IBlock * block );' in ctx.files[class_name + '.h']
+                cpp = ctx.files[class_name + '.cpp']
+                assert 'void {}::firstTouch( IBlock * block )'.format(class_name) in cpp
+                first_touch = cpp[cpp.index('_first_touch('):]
+                assert '#pragma omp parallel' in first_touch and '_data_src_tmp' in first_touch
+                # the fields of the block storage are already initialized by addToStorage and keep their values
+                kernel = first_touch[:first_touch.index('}\n}')]
+                assert '_data_src_tmp' in kernel and '_data_src[' not in kernel and '_data_src,' not in kernel
+                method = cpp[cpp.index('::firstTouch('):]
+                assert 'src_tmp = src->cloneUninitialized();' in method
+
+        with ManualCodeGenerationContext(openmp=True) as ctx:
+            # without temporary fields there is nothing to place
+            generate_sweep(ctx, 'InPlace', [ps.Assignment(src.center, 2 * src.center)])
+            assert 'firstTouch' not in ctx.files['InPlace.h']
+
+        with ManualCodeGenerationContext(openmp=False) as ctx:
+            generate_sweep(ctx, 'Jacobi', assignments, field_swaps=[(src, dst)])
+            assert 'firstTouch' not in ctx.files['Jacobi.h'] and '_first_touch' not in ctx.files['Jacobi.cpp']
+
+    @staticmethod
+    def test_cache_blocking():
+        src, dst = ps.fields("src, src_tmp: float64[3D]", layout='fzyx')
+        assignments = [ps.Assignment(dst[0, 0, 0], (src[1, 0, 0] + src[-1, 0, 0] + src[0, 0, 1]) / 3)]
+
+        with ManualCodeGenerationContext(openmp=True) as ctx:
+            generate_sweep(ctx, 'Jacobi', assignments, field_swaps=[(src, dst)], cache_blocking=True)
+            generate_sweep(ctx, 'JacobiInnerOuter', assignments, field_swaps=[(src, dst)], inner_outer_split=True,
+                           cache_blocking=(32, 8, 4))
+            # long tiles along x, the fastest coordinate of fzyx fields
+            assert 'int64_t tileSizeX_ = 256, int64_t tileSizeY_ = 16, int64_t tileSizeZ_ = 16)' in \
+                ctx.files['Jacobi.h']
+            assert 'int64_t tileSizeX_ = 32, int64_t tileSizeY_ = 8, int64_t tileSizeZ_ = 4)' in \
+                ctx.files['JacobiInnerOuter.h']
+            for class_name in ('Jacobi', 'JacobiInnerOuter'):
+                assert 'int64_t tileSizeZ;' in ctx.files[class_name + '.h']
+                cpp = ctx.files[class_name + '.cpp']
+                assert '_blockctr_2 += tileSizeZ' in cpp and 'collapse(3)' in cpp
+                assert 'tileSizeX, tileSizeY, tileSizeZ);' in cpp
+
+    @staticmethod
+    def test_fused_sweeps():
+        a, a_tmp, b, c = ps.fields("a, a_tmp, b, c: float64[3D]", layout='fzyx')
+        scale = ps.Assignment(a_tmp.center, a.center * 2)
+        shift = ps.Assignment(b.center, a_tmp.center + 1)
+        average = ps.Assignment(c.center, (b[1, 0, 0] + b[-1, 0, 0] + a_tmp[0, 0, 1]) / 3)
+
+        with ManualCodeGenerationContext() as ctx:
+            # point-wise chain: fused into one kernel, intermediate value passed on without reloading a_tmp
+            generate_sweep(ctx, 'PointWise', [[scale], [shift]])
+            point_wise = ctx.files['PointWise.cpp']
+            assert 'void pointwise(' in point_wise and '_stage' not in point_wise
+            assert point_wise.count('_data_a_tmp_20_10[') == 1
+
+            # stencil dependency: overlapped tiles, the point-wise part is computed one cell beyond each tile
+            generate_sweep(ctx, 'Fused', [[scale], [shift], [average]], cache_blocking=(64, 8, 8))
+            fused = ctx.files['Fused.cpp']
+            assert 'void fused_stage0(' in fused and 'void fused_stage1(' in fused and 'fused_stage2' not in fused
+            assert fused.count('ci.expand( Cell( 1, 1, 1 ) );') == 1
+            assert 'int64_t tileSizeX_ = 64, int64_t tileSizeY_ = 8, int64_t tileSizeZ_ = 8)' in ctx.files['Fused.h']
+            assert 'WALBERLA_CHECK_GREATER_EQUAL( a->nrOfGhostLayers(), uint_t( 1 ), ' in fused
+
+            # the first stage group is computed 2 cells beyond each tile, this does not fit into one ghost layer
+            wide = ps.Assignment(c.center, b[2, 0, 0] + b[-1, 0, 0])
+            try:
+                generate_sweep(ctx, 'Wide', [[scale], [shift], [wide]], ghost_layers=1)
+                assert False, "Expected ValueError"
+            except ValueError:
+                pass
+            generate_sweep(ctx, 'Wide', [[scale], [shift], [wide]], ghost_layers=3)
+
+        with ManualCodeGenerationContext(openmp=True) as ctx:
+            # one parallel loop over all tiles, the stage kernels run without OpenMP
+            generate_sweep(ctx, 'Fused', [[scale], [shift], [average]], cache_blocking=(64, 8, 8))
+            fused = ctx.files['Fused.cpp']
+            assert fused.count('#pragma omp') == 1
+            operator = fused[fused.index('void Fused::operator'):]
+            assert operator.index('#pragma omp parallel for schedule(dynamic)') < operator.index('fused_stage0(')
+            # concurrent tiles are disjoint including their overlaps: one parallel loop per color
+            assert operator.index('for( int64_t color = 0; color < 8; ++color )') < operator.index('#pragma omp')
+            assert 'const cell_idx_t x = cell_idx_c( 2 * ( t % colorTilesX ) + cx ) * cell_idx_c( tileSizeX );' \
+                in operator
+            assert "cell_idx_t( 2 ),\n" in operator and "have to be at least 2 cells wide" in operator
+
+            # in place update of a field, that an earlier stage reads with an offset
+            smooth = ps.Assignment(a.center, b[1, 0, 0] + b[-1, 0, 0])
+            in_place = ps.Assignment(b.center, a.center * 2)
+            try:
+                generate_sweep(ctx, 'InPlace', [[smooth], [in_place]])
+                assert False, "Expected ValueError"
+            except ValueError:
+                pass
+
+    @staticmethod
+    def test_checkpoint():
+        pdfs, rho = ps.fields("pdfs(19), rho: float64[3D]", layout='fzyx')
+
+        with ManualCodeGenerationContext() as ctx:
+            generate_checkpoint(ctx, 'Checkpoint', [pdfs, rho])
+            generate_checkpoint(ctx, 'NarrowCheckpoint', [pdfs, rho], checkpoint_data_type='float32',
+                                compression=True)
+
+            header = ctx.files['Checkpoint.h']
+            assert 'Checkpoint( BlockDataID pdfsID_, BlockDataID rhoID_ )' in header
+            assert 'void serialize( IBlock * block, std::vector< unsigned char > & buffer ) const;' in header
+            source = ctx.files['Checkpoint.cpp']
+            assert 'uint_t( 20 ) * sizeof( double )' in source
+            assert 'void pack_checkpoint(' in source and 'void unpack_checkpoint(' in source
+            assert 'shuffle' not in source
+
+            narrow = ctx.files['NarrowCheckpoint.cpp']
+            assert 'float * RESTRICT _data_buffer' in narrow and 'uint_t( 20 ) * sizeof( float )' in narrow
+            assert 'encode( shuffled.data(), dataSize, buffer );' in narrow
+            # corrupt compressed data must not read or write out of bounds
+            assert 'if( i + length > size || o + length > outSize )' in narrow
+            assert 'bufferSize > uint64_c( maxBufferSize )' in narrow
+
+        with ManualCodeGenerationContext(optimize_for_localhost=True) as ctx:
+            # the vectorizer does not support narrowing from float64 fields to a float32 buffer
+            generate_checkpoint(ctx, 'NarrowCheckpoint', [pdfs, rho], checkpoint_data_type='float32')
+            assert 'float * RESTRICT _data_buffer' in ctx.files['NarrowCheckpoint.cpp']
+
+    @staticmethod
+    def test_batched_gpu_pack_info():
+        pdfs = ps.fields("pdfs(19): float64[3D]", layout='fzyx')
+        src, dst = ps.fields("src, src_tmp: float64[3D]")
+        assignments = [ps.Assignment(dst[0, 0, 0], src[1, 0, 0] + src[-1, 0, 0] + src[0, 0, 1])]
+
+        with ManualCodeGenerationContext() as ctx:
+            ctx.cuda = True
+            generate_pack_info_for_field(ctx, 'PdfPackInfo', pdfs, target='gpu', batched=True)
+            generate_pack_info_from_kernel(ctx, 'JacobiPackInfo', assignments, target='gpu', batched=True)
+            generate_pack_info_from_kernel(ctx, 'PlainPackInfo', assignments, target='gpu')
+
+            header = ctx.files['PdfPackInfo.h']
+            assert 'void packBatched  (const std::vector< BatchEntry > & entries' in header
+            assert 'void unpackBatched(const std::vector< BatchEntry > & entries' in header
+
+            source = ctx.files['PdfPackInfo.cu']
+            run_batched = source[source.index('::runBatched('):source.index('::packBatched(')]
+            # one launch for all entries of the offset table, instead of one launch per direction
+            assert run_batched.count('<<<') == 2
+            assert 'internal_PdfPackInfo_batched::pack<<<_grid, _block, 0, stream>>>( batch, buffer );' in run_batched
+            assert 'batch.entries[batch.numEntries++]' in run_batched
+            # all directions are handled by the single batched kernel
+            direction_set = source[source.index('int64_t directionSet('):source.index('findEntry(')]
+            assert direction_set.count('case stencil::') == 27
+            assert '= s._data_pdfs[x * s._stride_pdfs_0 + y * s._stride_pdfs_1 + z * s._stride_pdfs_2 + ' \
+                   '18 * s._stride_pdfs_3];' in source
+            assert 's._data_pdfs[x * s._stride_pdfs_0 + y * s._stride_pdfs_1 + z * s._stride_pdfs_2] = b[0];' in source
+
+            # the values per cell are part of the offset table, the table of the host is not used on the device
+            assert '__global__ __launch_bounds__(256) void pack( const Batch batch, double * RESTRICT buffer )' \
+                in source
+            kernels = source[source.index('findEntry('):source.index('} // namespace internal_PdfPackInfo_batched')]
+            assert 'ELEMENTS_PER_CELL' not in kernels
+            assert kernels.count('* RESTRICT b = buffer + s.bufferOffset + s.elementsPerCell * c;') == 2
+            assert 's.elementsPerCell = ELEMENTS_PER_CELL[set];' in run_batched
+            assert 'bufferOffset += int64_c( ci.numCells() ) * s.elementsPerCell;' in run_batched
+
+            jacobi = ctx.files['JacobiPackInfo.cu']
+            assert 'static const int64_t ELEMENTS_PER_CELL[] = { 1, 1, 1 };' in jacobi
+            # src has 'c' layout, i.e. z fastest in memory: the buffer of `pack` is still indexed with x fastest,
+            # like the cell index `c` of the batched kernels
+            assert jacobi.count('x = s.xMin + c % s.xSize;') == 2
+            pack_b = jacobi[jacobi.index('void pack_B('):jacobi.index('void pack_E(')]
+            assert '_data_buffer[_size_src_0*_size_src_1*(blockDim.z*blockIdx.z + threadIdx.z) + ' \
+                   '_size_src_0*(blockDim.y*blockIdx.y + threadIdx.y) + blockDim.x*blockIdx.x + threadIdx.x]' in pack_b
+            assert 'packBatched' not in ctx.files['PlainPackInfo.h'] + ctx.files['PlainPackInfo.cu']
+
+        with ManualCodeGenerationContext() as ctx:
+            try:
+                generate_pack_info_for_field(ctx, 'PdfPackInfo', pdfs, batched=True)
+                assert False, "Batched packing should be rejected for the 'cpu' target"
+            except ValueError:
+                pass
+
+    def test_pack_info_from_kernel_sequence(self):
+        c, phi, c_tmp = ps.fields("c, phi, c_tmp: float64[3D]", layout='fzyx')
+        j = ps.fields("j(3): float64[3D]", layout='fzyx', field_type=ps.FieldType.STAGGERED)
+        flux = [ps.Assignment(j.staggered_access(d), (c.neighbor(i, -1) - c.center) * phi.center)
+                for i, d in enumerate(j.staggered_stencil)]
+        divergence = [ps.Assignment(c_tmp.center, c.center + sum(j(i) - j.neighbor(i, 1)(i) for i in range(3)))]
+
+        with ManualCodeGenerationContext() as ctx, self.assertLogs('pystencils_walberla', level='INFO') as logs:
+            generate_pack_info_from_kernels(ctx, 'DiffusionPackInfo', [(flux, 'pull'), (divergence, 'pull')],
+                                            communication_report=True)
+            source = ctx.files['DiffusionPackInfo.cpp']
+            # the staggered kernel computes the fluxes on the upper faces in the ghost layers itself, they are
+            # not communicated - only c, and phi for the faces in the ghost layers
+            assert 'void pack_W_S_B(' in source and 'void pack_T_N_E(' in source and 'pack_NE' not in source
+            assert '_data_j' not in source
+        report = "\n".join(logs.output)
+        assert "Communication of 'DiffusionPackInfo' in bytes per cell:" in report
+        assert 'W                 16        16' in report and 'E                  8        16' in report
+        assert 'total             72       416  (17.3% of full)' in report
+
+        with ManualCodeGenerationContext() as ctx:
+            try:
+                update = [ps.Assignment(c.center, c_tmp.neighbor(0, 1))]
+                generate_pack_info_from_kernels(ctx, 'Invalid', [(divergence, 'pull'), (update, 'pull')])
+                assert False, "Neighbor reads of values written earlier in the sequence should be rejected"
+            except ValueError:
+                pass
+
+    @staticmethod
+    def test_layout():
+        src, dst = ps.fields("src(2), dst(2): float64[3D]")
+        assignments = [ps.Assignment(dst(i), src[1, 0, 0](i) + src[-1, 0, 0](i)) for i in range(2)]
+
+        with ManualCodeGenerationContext() as ctx:
+            generate_sweep(ctx, 'SoA', assignments, layout='fzyx')
+            generate_sweep(ctx, 'AoS', assignments, layout='zyxf')
+            generate_sweep(ctx, 'Generic', assignments)
+
+            soa = ctx.files['SoA.cpp']
+            assert '_stride_src_0' not in soa and '_stride_src_3' in soa
+            assert 'WALBERLA_CHECK_EQUAL(int64_t(src->xStride()), int64_t(1), ' in soa
+            aos = ctx.files['AoS.cpp']
+            assert '_stride_src_3' not in aos and '_stride_src_0' in aos
+            assert 'WALBERLA_CHECK_EQUAL(int64_t(1 * int64_t(src->fStride())), int64_t(1), ' in aos
+            assert 'WALBERLA_CHECK' not in ctx.files['Generic.cpp']
+            # checked once per block, before any kernel runs, not in the chunks of the outer region
+            operator = soa[soa.index('void SoA::operator'):soa.index('void SoA::runOnCellInterval')]
+            assert operator.count('WALBERLA_CHECK_EQUAL') == 2
+            assert operator.index('WALBERLA_CHECK_EQUAL') < operator.index('internal_soa::soa(')
+            generate_sweep(ctx, 'SoASplit', assignments, layout='fzyx', inner_outer_split=True)
+            split = ctx.files['SoASplit.cpp']
+            outer = split[split.index('void SoASplit::outer'):split.index('void SoASplit::updateOuterRegion')]
+            loop = outer[outer.index('for( auto & ci: layers_ )'):]
+            assert 'WALBERLA_CHECK_EQUAL' in outer and 'WALBERLA_CHECK_EQUAL' not in loop
+            cost = split[split.index('::cost('):]
+            assert 'WALBERLA_CHECK_EQUAL' not in cost[:cost.index('}')]
+
+            try:
+                generate_sweep(ctx, 'Invalid', assignments, layout='xyzf')
+                assert False, "Unknown layouts should be rejected"
+            except ValueError:
+                pass
+
+            pdfs = ps.fields("pdfs(19): float64[3D]")
+            generate_pack_info_for_field(ctx, 'SoAPackInfo', pdfs, layout='fzyx')
+            generate_pack_info_for_field(ctx, 'AoSPackInfo', pdfs, layout='zyxf')
+            # 'fzyx': the buffer holds all cells of one value after another
+            soa = ctx.files['SoAPackInfo.cpp']
+            assert '_data_buffer + 18*_size_pdfs_0*_size_pdfs_1*_size_pdfs_2' in soa
+            # 'zyxf': the values of a cell are stored together, in the order of their memory locations
+            aos = ctx.files['AoSPackInfo.cpp']
+            pack = aos[aos.index('void pack_'):aos.index('void unpack_')]
+            values = [pack.index('19*ctr_0 + {}]'.format(i)) for i in range(1, 19)]
+            assert values == sorted(values)
+
+    @staticmethod
+    def test_contiguous_pack_copies():
+        pdfs = ps.fields("pdfs(3): float64[3D]")
+        spec = {((0, 0, 1), (0, 1, 0)): [pdfs(0), pdfs(2)], ((1, 0, 0),): [pdfs(1)]}
+
+        with ManualCodeGenerationContext() as ctx:
+            generate_pack_info(ctx, 'SoAPackInfo', spec, layout='fzyx')
+            generate_pack_info(ctx, 'AoSPackInfo', spec, layout='zyxf')
+            generate_pack_info_for_field(ctx, 'AoSFieldPackInfo', pdfs, layout='zyxf',
+                                         direction_subset=((0, 0, 1), (0, 0, -1)))
+            generate_pack_info_for_field(ctx, 'GenericPackInfo', pdfs, direction_subset=((0, 0, 1), (0, 0, -1)))
+
+            # 'fzyx': one x-row per packed value, slices in x-direction are not contiguous
+            soa = ctx.files['SoAPackInfo.cpp']
+            assert 'std::memcpy( b + 1 * numCells, pdfs->dataAt( ci.xMin(), y, z, 2 ), ' in soa
+            pack = soa[soa.index('void SoAPackInfo::pack('):soa.index('void SoAPackInfo::unpack(')]
+            assert 'internal_pack_E::pack_E(' in pack[pack.index('case stencil::E:'):]
+            # the unit x-stride is checked once at the top, the copy needs no fallback to the kernel
+            assert pack.count('WALBERLA_CHECK_EQUAL(int64_t(pdfs->xStride()), int64_t(1), ') == 1
+            assert pack.index('WALBERLA_CHECK_EQUAL') < pack.index('switch( dir )')
+            assert 'xStride() ==' not in soa and 'internal_pack_B_N::pack_B_N(' not in pack
+            # 'zyxf': a single x-row, if all values of the field are packed
+            assert 'memcpy' not in ctx.files['AoSPackInfo.cpp']
+            aos = ctx.files['AoSFieldPackInfo.cpp']
+            # padded cells are not excluded by the layout, in that case the kernel is called
+            assert 'if( pdfs->xStride() == 3 )' in aos and 'internal_unpack_T_B::unpack_T_B(' in aos
+            assert 'std::memcpy( pdfs->dataAt( ci.xMin(), y, z, 0 ), b, rowLength * sizeof( double ) );' in aos
+            assert '#include <cstring>' not in ctx.files['GenericPackInfo.cpp']
+
+            # all 27 directions in one set: the directions without x-component are copied, the others use the kernel
+            generate_pack_info_for_field(ctx, 'SoAFullPackInfo', pdfs, layout='fzyx')
+            generate_pack_info_for_field(ctx, 'AoSFullPackInfo', pdfs, layout='zyxf')
+            for class_name in ('SoAFullPackInfo', 'AoSFullPackInfo'):
+                source = ctx.files[class_name + '.cpp']
+                pack = source[source.index('::pack('):source.index('::unpack(')]
+                copy = pack[pack.index('case stencil::T:'):pack.index('break;')]
+                assert 'std::memcpy(' in copy and 'case stencil::E:' not in copy
+                kernel = pack[pack.index('case stencil::E:'):]
+                assert 'memcpy' not in kernel[:kernel.index('break;')] and 'internal_pack_' in kernel
+                unpack = source[source.index('::unpack('):]
+                assert 'std::memcpy( pdfs->dataAt( ci.xMin(), y, z, ' in unpack
+            assert ctx.files['SoAFullPackInfo.cpp'].count('std::memcpy(') == 2 * 3
+
+    @staticmethod
+    def test_outer_region_single_parallel_region():
+        src, dst = ps.fields("src, src_tmp: float64[3D]", layout='fzyx')
+        assignments = [ps.Assignment(dst[0, 0, 0], (src[1, 0, 0] + src[-1, 0, 0] + src[0, 0, 1]) / 3)]
+
+        with ManualCodeGenerationContext(openmp=True) as ctx:
+            generate_sweep(ctx, 'Jacobi', assignments, field_swaps=[(src, dst)], inner_outer_split=True)
+            assert 'void setOuterWidth( const Cell & lowerWidth, const Cell & upperWidth )' in ctx.files['Jacobi.h']
+            cpp = ctx.files['Jacobi.cpp']
+            outer = cpp[cpp.index('void Jacobi::outer'):cpp.index('void Jacobi::updateOuterRegion')]
+            # one dynamically scheduled loop over all slab chunks, calling a kernel without its own parallel region
+            assert outer.count('#pragma omp parallel for schedule(dynamic)') == 1
+            assert 'internal_jacobi_outer::jacobi_outer(' in outer
+            # alternatively one slab after another, each with the parallel loops of the main kernel
+            sequential = outer[outer.index('for( auto & ci: layers_ )'):]
+            assert 'internal_jacobi::jacobi(' in sequential and 'jacobi_outer' not in sequential
+            outer_kernel = cpp[cpp.index('void jacobi_outer('):cpp.index('void Jacobi::operator')]
+            assert '#pragma omp' not in outer_kernel
+            assert 'if( !layers_.empty() && fieldSize == layersFieldSize_ )' in cpp
+
+        with ManualCodeGenerationContext(openmp=False) as ctx:
+            generate_sweep(ctx, 'Jacobi', assignments, field_swaps=[(src, dst)], inner_outer_split=True)
+            assert 'jacobi_outer' not in ctx.files['Jacobi.cpp'] and 'chunks_' not in ctx.files['Jacobi.h']
+
+    @staticmethod
+    def test_communication_hiding_timestep():
+        with ManualCodeGenerationContext() as ctx:
+            src, dst = ps.fields("src, src_tmp: float64[3D]")
+            assignments = [ps.Assignment(dst[0, 0, 0], (src[1, 0, 0] + src[-1, 0, 0] + src[0, 1, 0] + src[0, -1, 0] +
+                                                        src[0, 0, 1] + src[0, 0, -1]) / 6)]
+            generate_sweep(ctx, 'JacobiSweep', assignments, field_swaps=[(src, dst)], inner_outer_split=True)
+            generate_pack_info_from_kernel(ctx, 'JacobiPackInfo', assignments)
+            generate_communication_hiding_timestep(ctx, 'JacobiTimestep', 'JacobiSweep', 'JacobiPackInfo',
+                                                   stencil='D3Q7', log_hidden_time=True,
+                                                   concurrent_outer_slabs=False)
+
+            timestep = ctx.files['JacobiTimestep.h']
+            assert 'UniformBufferedScheme< stencil::D3Q7 >' in timestep
+            order = ['communication_.startCommunication(', 'sweep_->inner(', 'communication_.wait(',
+                     'sweep_->outer(']
+            positions = [timestep.index(e) for e in order]
+            assert positions == sorted(positions)
+            assert 'sweep_->setOuterSlabsConcurrent( false );' in timestep
+            # the hidden time is bounded by the time of a blocking exchange, which is measured separately
+            log_method = timestep[timestep.index('void logHiddenCommunicationTime( uint_t exchanges = 10 )'):]
+            assert 'const double communication = measureCommunicationTime( exchanges );' in log_method
+            assert 'std::min( timing_["inner"].average(), std::max( communication - exposed, 0.0 ) )' in log_method